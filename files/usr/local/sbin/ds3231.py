@@ -51,9 +51,10 @@
 """
 
 import time
-import smbus
 from datetime import datetime, timedelta
-import arrow                                  # local/utc conversions
+
+import ds3231_bcd as bcd                      # BCD encoding/decoding
+import ds3231_transport                       # i2c-transfers
 
 # set I2c bus addresses of clock module and non-volatile ram 
 DS3231ADDR = 0x68 #known versions of DS3231 use 0x68
@@ -61,58 +62,369 @@ AT24C32ADDR = 0x57  #older boards use 0x56
 
 I2C_PORT = 1 #valid ports are 0 and 1
 
-def _bcd_to_int(bcd):
-    """
-    Decode a 2x4bit BCD to a integer.
-    """
-    out = 0
-    for digit in (bcd >> 4, bcd):
-        for value in (1, 2, 4, 8):
-            if digit & 1:
-                out += value
-            digit >>= 1
-        out *= 10
-    return out / 10
+AT24C32_SIZE      = 4096    # bytes
+AT24C32_PAGE_SIZE = 32      # bytes, page writes must not cross a page
+AT24C32_WRITE_TIMEOUT = 0.05 # seconds, max. write cycle time is 20ms
+AT24C32_POLL_INTERVAL = 0.0005 # seconds between two ACK polls
 
+ALARM_POLL_MIN = 0.01       # seconds, first interval of wait_for_alarm()
+ALARM_POLL_MAX = 1.0        # seconds, max. interval of wait_for_alarm()
 
-def _int_to_bcd(number):
-    """
-    Encode a one or two digits number to the BCD format.
-    """
-    bcd = 0
-    for idx in (number // 10, number % 10):
-        for value in (8, 4, 2, 1):
-            if idx >= value:
-                bcd += 1
-                idx -= value
-            bcd <<= 1
-    return bcd >> 1
+TICK_POLL    = 0.002        # seconds, polling interval of read_datetime_tick()
+TICK_TIMEOUT = 1.5          # seconds, the seconds-register must tick within
+
+SYNC_MARGIN  = 0.05         # seconds, min. time to prepare write_datetime_sync()
+SYNC_PROBES  = 2            # timed reads measuring the bus latency
 
+CONV_POLL    = 0.01         # seconds, polling interval of trigger_conversion()
+CONV_TIMEOUT = 0.5          # seconds, a conversion takes at most 0.2s
 
-def _set_bit(value,index,state):
+def _runs(regs):
     """
-    Set bit given by index (zero-based) in value to state and return the result
+    Split a dict register->value into a list of (start,values) tuples
+    of consecutive registers
     """
-    mask = 1 << index
-    value &= ~mask
-    if state:
-        value |= mask
-    return value
+    runs = []
+    for reg in sorted(regs):
+        if runs and runs[-1][0] + len(runs[-1][1]) == reg:
+            runs[-1][1].append(regs[reg])
+        else:
+            runs.append((reg,[regs[reg]]))
+    return runs
+
+def _local_is_utc():
+  """
+  Check if the local timezone is UTC. In this case no conversions are
+  necessary and the timezone index is never built.
+  """
+  return time.timezone == 0 and not time.daylight
 
 def _local2utc(dtime):
   """
   Convert a naive datetime-object in local-time to UTC
   """
-  a = arrow.get(dtime,'local')
-  return a.to('utc').naive
+  if _local_is_utc():
+    return dtime
+  import ds3231_tz                              # local/utc conversions
+  return ds3231_tz.get_index().local2utc(dtime)
 
 def _utc2local(dtime):
   """
   Convert a naive datetime-object in UTC to local-time
   """
-  a = arrow.get(dtime,'utc')
-  return a.to('local').naive
-  
+  if _local_is_utc():
+    return dtime
+  import ds3231_tz
+  return ds3231_tz.get_index().utc2local(dtime)
+
+def _decode_time(regs):
+    """
+    Decode the raw time registers 0x00-0x06 into a tuple
+    (year, month, daynum, dayname, hours, minutes, seconds).
+    """
+    (seconds,minutes,hours,day,date,month,year) = bcd.decode_block(regs[0:7])
+    return (year,month,date,day,hours,minutes,seconds)
+
+def _encode_time(dtime):
+    """
+    Encode a datetime into the raw time registers 0x00-0x06.
+    """
+    return [bcd.int_to_bcd(dtime.second),bcd.int_to_bcd(dtime.minute),
+            bcd.int_to_bcd(dtime.hour),dtime.isoweekday(),
+            bcd.int_to_bcd(dtime.day),bcd.int_to_bcd(dtime.month),
+            bcd.int_to_bcd(dtime.year % 100)]
+
+def _decode_alarm(alarm,regs):
+    """
+    Decode the raw registers of the given alarm (alarm1: 0x07-0x0A,
+    alarm2: 0x0B-0x0D) into a tuple (day-of-month,day-of-week,hour,min,sec).
+    Values not relevant due to the mask bits are None.
+    """
+    if alarm == 1:
+        if regs[0] & 0x80:
+            # we fire every second
+            return (None,None,None,None,None)
+        sec = bcd.bcd_to_int(regs[0] & 0x7F)
+        regs = regs[1:]
+    else:
+        sec = 0
+
+    # minutes
+    if regs[0] & 0x80:
+        # alarm when seconds match
+        return (None,None,None,None,sec)
+    min = bcd.bcd_to_int(regs[0] & 0x7F)
+
+    # hour
+    if regs[1] & 0x80:
+        # alarm when minutes match
+        return (None,None,None,min,sec)
+    hour = bcd.bcd_to_int(regs[1] & 0x7F)
+
+    # day-in-month/day-of-week
+    if regs[2] & 0x80:
+        # alarm when hour match
+        return (None,None,hour,min,sec)
+    elif regs[2] & 0x40:
+        # DY/DT (bit 6) is 1
+        return (None,bcd.bcd_to_int(regs[2] & 0x3F),hour,min,sec)
+    else:
+        return (bcd.bcd_to_int(regs[2] & 0x3F),None,hour,min,sec)
+
+# recurring alarms: mode -> (keyword,fields)
+RECURRING = {'second':  ('every-second',()),
+             'minute':  ('every-minute',('second',)),
+             'hour':    ('hourly',('minute','second')),
+             'day':     ('daily',('hour','minute','second')),
+             'weekday': ('weekly',('weekday','hour','minute','second')),
+             'month':   ('monthly',('day','hour','minute','second'))}
+
+_WEEKDAYS = ('mon','tue','wed','thu','fri','sat','sun')
+
+def recurring_fields(every,dtime):
+    """
+    Return the fields of a datetime relevant for a recurring alarm as
+    a dict (weekday: 1=monday ... 7=sunday)
+    """
+    values = {'day': dtime.day, 'weekday': dtime.isoweekday(),
+              'hour': dtime.hour, 'minute': dtime.minute,
+              'second': dtime.second}
+    return dict((f,values[f]) for f in RECURRING[every][1])
+
+def next_recurring(after,every,second=0,minute=0,hour=0,weekday=None,day=None):
+    """
+    Return the first datetime after the given datetime matching the
+    recurring alarm.
+    """
+    if not every in RECURRING:
+        raise ValueError("invalid recurrence: %r" % every)
+    fields = dict(day=day,weekday=weekday,hour=hour,minute=minute,
+                  second=second)
+    alarm_t = tuple(fields[f] if f in RECURRING[every][1] else None
+                    for f in ('day','weekday','hour','minute','second'))
+    import ds3231_alarm
+    return ds3231_alarm.next_match(alarm_t,after)
+
+def parse_recurring(words):
+    """
+    Parse a recurring alarm, e.g. ['daily','06:00'] or
+    ['weekly','mon','06:00:30']. Returns a tuple (every,fields).
+    """
+    modes = dict((keyword,every) for every,(keyword,_) in RECURRING.items())
+    if not words or not words[0] in modes:
+        raise ValueError("invalid recurrence: %s" % " ".join(words))
+    every = modes[words[0]]
+    names = RECURRING[every][1]
+    values = []
+    for word in words[1:]:
+        if word.lower()[:3] in _WEEKDAYS:
+            values.append(_WEEKDAYS.index(word.lower()[:3])+1)
+        else:
+            values.extend(int(v) for v in word.split(':'))
+    if len(values) > len(names) or len(values) < len(names) - 1 - (
+            every in ('minute','hour')):
+        raise ValueError("invalid recurrence: %s" % " ".join(words))
+    # seconds (and minutes/seconds for every-minute/hourly) are optional
+    fields = dict((name,0) for name in names)
+    fields.update(zip(names,values))
+    return (every,fields)
+
+def format_recurring(every,fields):
+    """
+    Inverse of parse_recurring(): return a string like "daily 06:00:00"
+    """
+    words = [RECURRING[every][0]]
+    if 'day' in fields:
+        words.append(str(fields['day']))
+    if 'weekday' in fields:
+        words.append(_WEEKDAYS[fields['weekday']-1])
+    words.append(":".join("%02d" % fields[f] for f in ('hour','minute','second')
+                          if f in fields))
+    return " ".join(w for w in words if w)
+
+def _decode_temp(msb,lsb):
+    """
+    Decode the temperature registers (two's complement, 0.25 degrees
+    resolution in bits 7 and 6 of the LSB)
+    """
+    if msb & 0x80:
+        msb -= 256
+    return msb + (lsb >> 6) * 0.25
+
+class register_map(object):
+    """
+    Immutable snapshot of the registers 0x00-0x12 of the DS3231 with
+    decoded accessors.
+    """
+
+    __slots__ = ('_regs',)
+
+    def __init__(self,regs):
+        """
+        Create the snapshot from a sequence of raw register values.
+        """
+        object.__setattr__(self,'_regs',tuple(regs))
+
+    def __setattr__(self,name,value):
+        raise AttributeError("register_map is immutable")
+
+    def register(self,reg):
+        """
+        Return the raw value of the given register.
+        """
+        return self._regs[reg]
+
+    def block(self,register,length):
+        """
+        Return the raw values of length consecutive registers.
+        """
+        return list(self._regs[register:register+length])
+
+    def time(self):
+        """
+        Return a tuple (year, month, daynum, dayname, hours, minutes, seconds).
+        """
+        return _decode_time(self._regs)
+
+    def alarm(self,alarm):
+        """
+        Return the decoded alarm as tuple (day-of-month,day-of-week,hour,min,sec).
+        """
+        return _decode_alarm(alarm,self.block(*ds3231._ALARM_REGISTERS[alarm]))
+
+    def alarm_masks(self,alarm):
+        """
+        Return the mask bits of the given alarm as a tuple of booleans:
+        (A1M1,A1M2,A1M3,A1M4,DY/DT) for alarm1 and (A2M2,A2M3,A2M4,DY/DT)
+        for alarm2.
+        """
+        regs = self.block(*ds3231._ALARM_REGISTERS[alarm])
+        return tuple(bool(r & 0x80) for r in regs) + (bool(regs[-1] & 0x40),)
+
+    def alarm_state(self,alarm):
+        """
+        Return the state of the given alarm as tuple (enabled,fired).
+        """
+        return (bool(self.control & alarm),bool(self.status & alarm))
+
+    @property
+    def control(self):
+        """ raw value of the control-register """
+        return self._regs[ds3231._CONTROL_REGISTER]
+
+    @property
+    def status(self):
+        """ raw value of the status-register """
+        return self._regs[ds3231._STATUS_REGISTER]
+
+    def temp(self):
+        """
+        Return the temperature in degrees Celsius.
+        """
+        return _decode_temp(self._regs[ds3231._TEMP_MSB_REGISTER],
+                            self._regs[ds3231._TEMP_LSB_REGISTER])
+
+class write_batch(object):
+    """
+    Collect register writes of a ds3231 and commit them with as few bus
+    transactions as possible. Use it through ds3231.transaction():
+
+        with rtc.transaction():
+            rtc.set_alarm_time(1,dtime)
+            rtc.set_alarm(1,1)
+
+    Consecutive registers are written with a single block write, bit
+    changes of the same register are merged into one read-modify-write.
+    Nothing is written if the block raises an exception. Nested
+    transactions join the outermost one.
+    """
+
+    # bits checked during verification: the time registers tick, CONV
+    # clears itself and the flags of the status register are set by the
+    # hardware
+    _VERIFY_MASKS = {0x00: 0x00, 0x01: 0x00, 0x02: 0x00, 0x03: 0x00,
+                     0x04: 0x00, 0x05: 0x00, 0x06: 0x00,
+                     0x0E: 0xDF, 0x0F: 0x08}
+
+    def __init__(self,rtc,verify=False):
+        """
+        Create a batch for the given rtc. With verify=True, the written
+        registers are read back with a single block read after the commit.
+        """
+        self._rtc    = rtc
+        self._verify = verify
+        self._outer  = None
+        self._regs   = {}                  # register -> value
+        self._bits   = {}                  # register -> (and_mask,or_mask)
+
+    def __enter__(self):
+        if self._rtc._batch is not None:
+            self._outer = self._rtc._batch
+            self._outer._verify = self._outer._verify or self._verify
+            return self._outer
+        self._rtc._batch = self
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if self._outer is not None:
+            return False
+        self._rtc._batch = None
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def write(self,register,value):
+        """
+        Queue a write of a complete register.
+        """
+        self._regs[register] = value
+        self._bits.pop(register,None)
+
+    def update_bits(self,register,and_mask,or_mask):
+        """
+        Queue a read-modify-write of a register: new = (old & and_mask) | or_mask
+        """
+        if register in self._regs:
+            self._regs[register] = (self._regs[register] & and_mask) | or_mask
+        else:
+            (a,o) = self._bits.get(register,(0xFF,0x00))
+            self._bits[register] = (a & and_mask,(o & and_mask) | or_mask)
+
+    def commit(self):
+        """
+        Write all queued changes to the rtc.
+        """
+        rtc = self._rtc
+        if self._bits:
+            # one read for all read-modify-write registers
+            regs = sorted(self._bits)
+            rtc.invalidate()
+            old = rtc._read_registers(regs[0],regs[-1]-regs[0]+1)
+            for reg in regs:
+                (a,o) = self._bits[reg]
+                self._regs[reg] = (old[reg-regs[0]] & a) | o
+            self._bits = {}
+
+        for (start,values) in _runs(self._regs):
+            rtc._write_registers(start,values)
+        if self._verify:
+            self._verify_registers()
+        self._regs = {}
+
+    def _verify_registers(self):
+        """
+        Read back the written registers and compare them.
+        """
+        regs = [reg for reg in self._regs if self._VERIFY_MASKS.get(reg,0xFF)]
+        if not regs:
+            return
+        start = min(regs)
+        values = self._rtc._read_registers(start,max(regs)-start+1)
+        for reg in regs:
+            mask = self._VERIFY_MASKS.get(reg,0xFF)
+            if (values[reg-start] ^ self._regs[reg]) & mask:
+                raise IOError("verification of register 0x%02X failed" % reg)
+
 class ds3231(object):
     """
     Define the methods needed to read and update the real-time-clock module.
@@ -140,18 +452,66 @@ class ds3231(object):
     _CONTROL_REGISTER      = 0x0E
     _STATUS_REGISTER       = 0x0F
 
-    _AGING_REGISTER        = 0x10             # unused
+    _AGING_REGISTER        = 0x10
     _TEMP_MSB_REGISTER     = 0x11
     _TEMP_LSB_REGISTER     = 0x12
 
-    def __init__(self, port=I2C_PORT, utc=True,addr=DS3231ADDR, at24c32_addr=AT24C32ADDR):
+    _TIME_REGISTER_COUNT   = 7                # 0x00-0x06
+    _REGISTER_COUNT        = 0x13             # 0x00-0x12
+
+    # (offset,length) of the alarm registers
+    _ALARM_REGISTERS       = {1: (0x07,4), 2: (0x0B,3)}
+
+    def __init__(self, port=I2C_PORT, utc=True,addr=DS3231ADDR, at24c32_addr=AT24C32ADDR,
+                 burst=True, transport="smbus"):
         """
-        ???
+        Open the i2c-bus. With burst=True (default), the time registers
+        are read with a single block read. Set burst to False for
+        adapters without support for i2c-block reads.
+        transport is one of "smbus" (default), "i2cdev" or "sim[:state-file]"
+        (see ds3231_transport.py) or a transport-object.
         """
-        self._bus = smbus.SMBus(port) #valid ports are 0 and 1
+        self._transport = ds3231_transport.get_transport(transport,port)
         self._utc = utc
         self._addr = addr
         self._at24c32_addr = at24c32_addr
+        self._burst = burst
+        self._snapshot = None                 # cached register_map
+        self._batch = None                    # active write_batch
+        self.stats = ds3231_transport.bus_stats()   # per bus operation
+
+    @property
+    def transactions(self):
+        """ number of bus transactions """
+        return self._transport.transactions
+
+    @transactions.setter
+    def transactions(self,value):
+        self._transport.transactions = value
+
+    @property
+    def transport(self):
+        """ the transport used for all i2c-transfers """
+        return self._transport
+
+    def _bus(self, op, func, *args):
+        """
+        Execute a transfer of the transport and record it in the statistics
+        of the operation op.
+        """
+        (start,count) = (time.time(),self._transport.transactions)
+        try:
+            return func(*args)
+        finally:
+            self.stats.record(op,time.time()-start,
+                              self._transport.transactions-count)
+
+    def get_bus_stats(self):
+        """
+        Return the statistics of the bus operations (see
+        ds3231_transport.bus_stats) as dict operation -> dict.
+        """
+        return self.stats.ops
 
     ###########################
     # DS3231 real time clock functions
@@ -159,27 +519,98 @@ class ds3231(object):
     
     def _write(self, register, data):
         """
-        ???
+        Write a single register. Within a transaction, the write is queued.
+        """
+        if self._batch is not None:
+            self._batch.write(register,data)
+        else:
+            self._write_registers(register,[data])
+
+    def _update_bits(self, register, and_mask, or_mask):
+        """
+        Read-modify-write of a single register (part of a transaction).
         """
-        self._bus.write_byte_data(self._addr, register, data)
+        with self.transaction() as batch:
+            batch.update_bits(register,and_mask,or_mask)
+
+    def _write_registers(self, register, values):
+        """
+        Write consecutive registers starting at register. In burst mode,
+        this is a single bus transaction. This invalidates a cached snapshot.
+        """
+        self._snapshot = None
+        if len(values) == 1 or self._burst:
+            self._bus("write",self._transport.write_registers,
+                      self._addr, register, values)
+        else:
+            for offset,value in enumerate(values):
+                self._write_registers(register+offset,[value])
+
+    def transaction(self, verify=False):
+        """
+        Return a write_batch collecting all writes until the end of the
+        with-block. With verify=True, the written registers are read back.
+        """
+        return write_batch(self,verify)
 
     def _read(self, data):
         """
-        ???
+        Read a single register.
         """
-        return self._bus.read_byte_data(self._addr, data)
+        return self._bus("read",self._transport.read_registers,
+                         self._addr, data, 1)[0]
+
+    def _read_block(self, register, length):
+        """
+        Read length consecutive registers starting at register with a
+        single bus transaction. Returns a list of raw register values.
+        """
+        return self._bus("read",self._transport.read_registers,
+                         self._addr, register, length)
+
+    def _read_registers(self, register, length):
+        """
+        Read length consecutive registers. Use a cached snapshot if
+        available, otherwise read from the bus (a single transaction in
+        burst mode).
+        """
+        if self._snapshot is not None:
+            return self._snapshot.block(register,length)
+        elif self._burst and length > 1:
+            return self._read_block(register,length)
+        else:
+            return [self._read(reg) for reg in range(register,register+length)]
+
+    def snapshot(self, refresh=False):
+        """
+        Read all registers 0x00-0x12 at once and return them as an
+        immutable register_map. The snapshot is cached and serves all
+        read-methods until it is invalidated, either explicitly with
+        invalidate() or implicitly by a write.
+        """
+        if self._snapshot is None or refresh:
+            self._snapshot = None
+            self._snapshot = register_map(
+                self._read_registers(self._SECONDS_REGISTER,self._REGISTER_COUNT))
+        return self._snapshot
+
+    def invalidate(self):
+        """
+        Drop the cached snapshot, i.e. read the registers from the bus again.
+        """
+        self._snapshot = None
 
     def _read_seconds(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._SECONDS_REGISTER) & 0x7F)   # wipe out the oscillator on bit
+        return bcd.bcd_to_int(self._read(self._SECONDS_REGISTER) & 0x7F)   # wipe out the oscillator on bit
 
     def _read_minutes(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._MINUTES_REGISTER))
+        return bcd.bcd_to_int(self._read(self._MINUTES_REGISTER))
 
     def _read_hours(self):
         """
@@ -188,102 +619,146 @@ class ds3231(object):
         tmp = self._read(self._HOURS_REGISTER)
         if tmp == 0x64:
             tmp = 0x40
-        return _bcd_to_int(tmp & 0x3F)
+        return bcd.bcd_to_int(tmp & 0x3F)
 
     def _read_day(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._DAY_OF_WEEK_REGISTER))
+        return bcd.bcd_to_int(self._read(self._DAY_OF_WEEK_REGISTER))
 
     def _read_date(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._DAY_OF_MONTH_REGISTER))
+        return bcd.bcd_to_int(self._read(self._DAY_OF_MONTH_REGISTER))
 
     def _read_month(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._MONTH_REGISTER) & 0x1F)
+        return bcd.bcd_to_int(self._read(self._MONTH_REGISTER) & 0x1F)
 
     def _read_year(self):
         """
         ???
         """
-        return _bcd_to_int(self._read(self._YEAR_REGISTER))
+        return bcd.bcd_to_int(self._read(self._YEAR_REGISTER))
 
     def read_all(self):
         """
         Return a tuple such as (year, month, daynum, dayname, hours, minutes, seconds).
         """
-        return (self._read_year(), self._read_month(), self._read_date(),
-                self._read_day(), self._read_hours(), self._read_minutes(),
-                self._read_seconds())
+        return _decode_time(self._read_registers(self._SECONDS_REGISTER,
+                                                 self._TIME_REGISTER_COUNT))
 
     def read_str(self):
         """
         Return a string such as 'YY-DD-MMTHH-MM-SS'.
         """
-        return '%02d-%02d-%02dT%02d:%02d:%02d' % (self._read_year(),
-                self._read_month(), self._read_date(), self._read_hours(),
-                self._read_minutes(), self._read_seconds())
+        (year,month,date,_,hours,minutes,seconds) = self.read_all()
+        return '%02d-%02d-%02dT%02d:%02d:%02d' % (year,
+                month, date, hours, minutes, seconds)
 
     def read_datetime(self):
         """
         Return the datetime.datetime object.
         """
-        dtime =  datetime(2000 + self._read_year(),
-                self._read_month(), self._read_date(), self._read_hours(),
-                self._read_minutes(), self._read_seconds(), 0)
+        (year,month,date,_,hours,minutes,seconds) = self.read_all()
+        dtime =  datetime(2000 + year, month, date, hours, minutes, seconds, 0)
         if (self._utc):
           return _utc2local(dtime)
         else:
           return dtime
 
+    def read_timestamp(self):
+        """
+        Return the time of the RTC as seconds since the epoch. Unlike
+        read_datetime(), this needs no conversion to local time.
+        """
+        (year,month,date,_,hours,minutes,seconds) = self.read_all()
+        if not self._utc:
+            return time.mktime((2000 + year, month, date, hours, minutes,
+                                seconds, 0, 0, -1))
+        delta = datetime(2000 + year, month, date, hours, minutes,
+                         seconds) - datetime(1970,1,1)
+        return delta.days*86400 + delta.seconds
+
+    def read_datetime_tick(self,poll=TICK_POLL,timeout=TICK_TIMEOUT):
+        """
+        Wait for the next tick of the seconds-register and return a tuple
+        (datetime,timestamp): the datetime of the RTC right after the tick
+        and the system time (time.time()) of the tick. The error of the
+        timestamp is about half the polling interval plus the latency of
+        a bus transaction.
+        """
+        return self.read_tick(poll,timeout)[0:2]
+
+    def read_tick(self,poll=TICK_POLL,timeout=TICK_TIMEOUT):
+        """
+        Like read_datetime_tick(), but return a tuple
+        (datetime,timestamp,error) where error is the maximal error of the
+        timestamp in seconds (half the time between the last two polls).
+        Only the seconds-register is polled.
+        """
+        self._snapshot = None
+        first = self._read(self._SECONDS_REGISTER)
+        (last,deadline) = (time.time(),time.time()+timeout)
+        while True:
+            time.sleep(poll)
+            value = self._read(self._SECONDS_REGISTER)
+            now = time.time()
+            if value != first:
+                break
+            elif now > deadline:
+                raise IOError("seconds-register does not tick")
+            last = now
+        return (self.read_datetime(),(last+now)/2,(now-last)/2)
+
     def write_all(self, seconds=None, minutes=None, hours=None, day_of_week=None,
             day_of_month=None, month=None, year=None):
         """
-        Direct write each user specified value.
+        Direct write each user specified value (with a single block write
+        if possible).
         Range: seconds [0,59], minutes [0,59], hours [0,23],
                  day_of_week [0,7], day_of_month [1-31], month [1-12], year [0-99].
         """
-        if seconds is not None:
-            if seconds < 0 or seconds > 59:
-                raise ValueError('Seconds is out of range [0,59].')
-            seconds_reg = _int_to_bcd(seconds)
-            self._write(self._SECONDS_REGISTER, seconds_reg)
-
-        if minutes is not None:
-            if minutes < 0 or minutes > 59:
-                raise ValueError('Minutes is out of range [0,59].')
-            self._write(self._MINUTES_REGISTER, _int_to_bcd(minutes))
-
-        if hours is not None:
-            if hours < 0 or hours > 23:
-                raise ValueError('Hours is out of range [0,23].')
-            self._write(self._HOURS_REGISTER, _int_to_bcd(hours)) # not  | 0x40 according to datasheet
-
-        if year is not None:
-            if year < 0 or year > 99:
-                raise ValueError('Years is out of range [0, 99].')
-            self._write(self._YEAR_REGISTER, _int_to_bcd(year))
-
-        if month is not None:
-            if month < 1 or month > 12:
-                raise ValueError('Month is out of range [1, 12].')
-            self._write(self._MONTH_REGISTER, _int_to_bcd(month))
-
-        if day_of_month is not None:
-            if day_of_month < 1 or day_of_month > 31:
-                raise ValueError('Day_of_month is out of range [1, 31].')
-            self._write(self._DAY_OF_MONTH_REGISTER, _int_to_bcd(day_of_month))
-
-        if day_of_week is not None:
-            if day_of_week < 1 or day_of_week > 7:
-                raise ValueError('Day_of_week is out of range [1, 7].')
-            self._write(self._DAY_OF_WEEK_REGISTER, _int_to_bcd(day_of_week))
+        with self.transaction():
+            if seconds is not None:
+                if seconds < 0 or seconds > 59:
+                    raise ValueError('Seconds is out of range [0,59].')
+                seconds_reg = bcd.int_to_bcd(seconds)
+                self._write(self._SECONDS_REGISTER, seconds_reg)
+
+            if minutes is not None:
+                if minutes < 0 or minutes > 59:
+                    raise ValueError('Minutes is out of range [0,59].')
+                self._write(self._MINUTES_REGISTER, bcd.int_to_bcd(minutes))
+
+            if hours is not None:
+                if hours < 0 or hours > 23:
+                    raise ValueError('Hours is out of range [0,23].')
+                self._write(self._HOURS_REGISTER, bcd.int_to_bcd(hours)) # not  | 0x40 according to datasheet
+
+            if year is not None:
+                if year < 0 or year > 99:
+                    raise ValueError('Years is out of range [0, 99].')
+                self._write(self._YEAR_REGISTER, bcd.int_to_bcd(year))
+
+            if month is not None:
+                if month < 1 or month > 12:
+                    raise ValueError('Month is out of range [1, 12].')
+                self._write(self._MONTH_REGISTER, bcd.int_to_bcd(month))
+
+            if day_of_month is not None:
+                if day_of_month < 1 or day_of_month > 31:
+                    raise ValueError('Day_of_month is out of range [1, 31].')
+                self._write(self._DAY_OF_MONTH_REGISTER, bcd.int_to_bcd(day_of_month))
+
+            if day_of_week is not None:
+                if day_of_week < 1 or day_of_week > 7:
+                    raise ValueError('Day_of_week is out of range [1, 7].')
+                self._write(self._DAY_OF_WEEK_REGISTER, bcd.int_to_bcd(day_of_week))
 
     def write_datetime(self, dtime):
         """
@@ -292,7 +767,8 @@ class ds3231(object):
         if(self._utc):
             dtime = _local2utc(dtime)
 
-        self.write_all(dtime.second, dtime.minute, dtime.hour,
+        with self.transaction():
+            self.write_all(dtime.second, dtime.minute, dtime.hour,
                 dtime.isoweekday(), dtime.day, dtime.month, dtime.year % 100)
 
     def write_system_datetime_now(self):
@@ -301,8 +777,44 @@ class ds3231(object):
         """
         self.write_datetime(datetime.now())
 
+    def write_datetime_sync(self,margin=SYNC_MARGIN):
+        """
+        Set the RTC to the system time at the next second boundary of the
+        system time. The DS3231 restarts its second when the seconds-register
+        is written, so all time registers are written with one block write
+        centered on the boundary: it starts half the bus latency (measured
+        with timed block reads of the time registers) before the boundary.
+
+        Returns a tuple (timestamp,error,bound): the written second (system
+        time), the estimated error of the write (middle of the transfer minus
+        the boundary) and its bound (half the latency), both in seconds.
+        """
+        if self._batch is not None:
+            raise ValueError("no synchronized write within a transaction")
+        self._snapshot = None
+        probes = []
+        for _ in range(SYNC_PROBES):
+            start = time.time()
+            self._read_registers(self._SECONDS_REGISTER,
+                                 self._TIME_REGISTER_COUNT)
+            probes.append(time.time() - start)
+        latency = min(probes)
+
+        stamp = int(time.time() + latency/2 + margin) + 1
+        dtime = datetime.fromtimestamp(stamp)
+        if self._utc:
+            dtime = _local2utc(dtime)
+        regs = _encode_time(dtime)
+        delay = stamp - latency/2 - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        start = time.time()
+        self._write_registers(self._SECONDS_REGISTER,regs)
+        end = time.time()
+        return (stamp,(start+end)/2 - stamp,(end-start)/2)
+
     #######################################################################
-    # SDL_DS3231 alarm handling. Recurring alarms are currently unsupported.
+    # SDL_DS3231 alarm handling. Recurring alarms use the mask bits.
     ########################################################################
     
     def set_alarm_time(self,alarm,dtime):
@@ -314,180 +826,237 @@ class ds3231(object):
         if (self._utc):
             dtime = _local2utc(dtime)
 
-        if alarm == 1:
-            self._write(self._ALARM1_SEC_REGISTER, _int_to_bcd(dtime.second))
-            self._write(self._ALARM1_MIN_REGISTER, _int_to_bcd(dtime.minute))
-            self._write(self._ALARM1_HOUR_REGISTER, _int_to_bcd(dtime.hour))
-            self._write(self._ALARM1_DATE_REGISTER, _int_to_bcd(dtime.day))
-        else:
-            self._write(self._ALARM2_MIN_REGISTER, _int_to_bcd(dtime.minute))
-            self._write(self._ALARM2_HOUR_REGISTER, _int_to_bcd(dtime.hour))
-            self._write(self._ALARM2_DATE_REGISTER, _int_to_bcd(dtime.day))
+        with self.transaction():
+            if alarm == 1:
+                self._write(self._ALARM1_SEC_REGISTER, bcd.int_to_bcd(dtime.second))
+                self._write(self._ALARM1_MIN_REGISTER, bcd.int_to_bcd(dtime.minute))
+                self._write(self._ALARM1_HOUR_REGISTER, bcd.int_to_bcd(dtime.hour))
+                self._write(self._ALARM1_DATE_REGISTER, bcd.int_to_bcd(dtime.day))
+            else:
+                self._write(self._ALARM2_MIN_REGISTER, bcd.int_to_bcd(dtime.minute))
+                self._write(self._ALARM2_HOUR_REGISTER, bcd.int_to_bcd(dtime.hour))
+                self._write(self._ALARM2_DATE_REGISTER, bcd.int_to_bcd(dtime.day))
 
-    def get_alarm_time(self,alarm,convert=True):
+    def set_alarm_recurring(self,alarm,every,second=0,minute=0,hour=0,
+                            weekday=None,day=None):
         """
-        Query the given alarm and construct a valid datetime-object or
-        a tuple (day-of-month/day-of-week,hour,min,sec) depending on the
-        convert flag.
-        """
-
-        # seconds
-        is_interval = False
-        if alarm == 1:
-            buffer = self._read(self._ALARM1_SEC_REGISTER)
-            if buffer & 0x80:
-                # we fire every second
-                if not convert:
-                    return (None,None,None,None,None)
-                else:
-                    return datetime.now()          # not very sensible
-            sec = _bcd_to_int(buffer & 0x7F)
-            offset = self._ALARM1_OFFSET + 1
-        else:
-            sec  = 0
-            offset = self._ALARM2_OFFSET
-
-        # minutes
-        buffer = self._read(offset)
-        if buffer & 0x80:
-            # alarm when seconds match
-            if not convert:
-                return (None,None,None,None,sec)
-            else:
-                return self._next_dt_match(alarm,None,None,None,None,sec)
-        min  = _bcd_to_int(buffer & 0x7F)
-
-        # hour
-        offset = offset + 1
-        buffer = self._read(offset)
-        if buffer & 0x80:
-            # alarm when minutes match
-            if not convert:
-                return (None,None,None,min,sec)
-            else:
-                return self._next_dt_match(alarm,None,None,None,min,sec)
-        hour = _bcd_to_int(buffer & 0x7F)
-
-        # day-in-month/day-of-week
-        offset = offset + 1
-        buffer = self._read(offset)
-        if buffer & 0x80:
-            # alarm when hour match
-            if not convert:
-                return (None,None,hour,min,sec)
-            else:
-                return self._next_dt_match(alarm,None,None,hour,min,sec)
-        elif buffer & 0x40:
-            # DY/DT (bit 6) is 1
-            weekday  = _bcd_to_int(buffer & 0x3F)
-            day = None
+        Program a recurring alarm using the mask bits. every is one of
+        'second' (alarm1 only), 'minute', 'hour', 'day', 'weekday'
+        (weekday: 1=monday ... 7=sunday) or 'month' (day-of-month). Fields
+        not relevant for the recurrence are ignored. alarm2 has no seconds,
+        it fires at second 0.
+
+        Times are local times. With utc=True, the alarm is converted with
+        the current offset, i.e. it is off by the DST-change until it is
+        programmed again.
+        """
+        if not every in RECURRING:
+            raise ValueError("invalid recurrence: %r" % every)
+        if alarm == 2 and (every == 'second' or second):
+            raise ValueError("alarm2 does not support seconds")
+        if every == 'weekday' and not weekday in range(1,8):
+            raise ValueError("invalid weekday: %r" % weekday)
+        if every == 'month' and not day in range(1,32):
+            raise ValueError("invalid day: %r" % day)
+        if (not 0 <= second <= 59 or not 0 <= minute <= 59 or
+            not 0 <= hour <= 23):
+            raise ValueError("invalid time")
+
+        # fields in RTC-time from the next occurrence
+        if self._utc:
+            dtime = _local2utc(next_recurring(datetime.now(),every,second,
+                                              minute,hour,weekday,day))
+            fields = recurring_fields(every,dtime)
         else:
-            weekday = None
-            day  = _bcd_to_int(buffer & 0x3F)
-
-        if not convert:
-            return (day,weekday,hour,min,sec)
+            fields = dict(second=second,minute=minute,hour=hour,
+                          weekday=weekday,day=day)
+
+        # registers: sec (alarm1 only), min, hour, day, 0x80 is the mask bit
+        order = ('second','minute','hour')
+        matched = RECURRING[every][1]
+        regs = [bcd.int_to_bcd(fields[f]) if f in matched else 0x80
+                for f in order]
+        if every == 'weekday':
+            regs.append(0x40 | bcd.int_to_bcd(fields['weekday']))
+        elif every == 'month':
+            regs.append(bcd.int_to_bcd(fields['day']))
         else:
-            return self._next_dt_match(alarm,day,weekday,hour,min,sec)
-
-    def _next_dt_match(self,alarm,day,weekday,hour,min,sec):
+            regs.append(0x80)
+        if alarm == 2:
+            regs = regs[1:]
+        (offset,_) = self._ALARM_REGISTERS[alarm]
+        with self.transaction():
+            for i,value in enumerate(regs):
+                self._write(offset+i,value)
+
+    def get_alarm_recurring(self,alarm):
         """
-        Calculate the next alarm datetime (in case alarm did not fire yet)
-        or the last datetime if the alarm fired.
-        The former is exact while the latter is just a best guess - the
-        alarm could already have fired way in the past.
+        Query the recurrence of the given alarm. Returns a tuple (every,fields)
+        with fields as dict of local times (see set_alarm_recurring()).
+        A normal alarm (set_alarm_time()) is 'month'.
         """
-        if (self._utc):
-            now = datetime.utcnow()
-        else:
-            now = datetime.now()
-        # convert weekday to day of month
-        if not weekday == None:
-            now = now + timedelta((weekday - now.weekday()+7) % 7)
-            day = now.day
-        year = now.year
-        month = now.month
-
-        enabled,fired = self.get_alarm_state(alarm)
-
-        # first try: assume alarm is in the curren month
-        # we try to create a valid datetime object
-        try:
-            alarm_dtime = datetime(year,month,day,hour,min,sec)
-        except ValueError:
-            # day-of-month might not be valid for current month!
-            # no year roll-over necessary, since this won't happen
-            # for December or January
-            if fired:
-                month = month - 1         # alarm must have been in the past
-            else:
-                month = month + 1         # alarm date is in the future
-            alarm_dtime = datetime(year,month,day,hour,min,sec)
-
-        # check if first alarm-datetime is correct
-        # this depends on the state of the alarm
-        if now > alarm_dtime and not fired:
-            # alarm did not fire yet, but must be in the future
-            month = month + 1
-            if month > 12:
-                month = 1
-                year  = year + 1
-        elif now < alarm_dtime and fired:
-            # alarm fired, but must be in the past
-            month = month - 1
-            if month == 0:
-                month = 12
-                year = year - 1
+        (day,weekday,hour,minute,second) = _decode_alarm(alarm,
+                      self._read_registers(*self._ALARM_REGISTERS[alarm]))
+        if second is None:
+            every = 'second'
+        elif minute is None:
+            every = 'minute'
+        elif hour is None:
+            every = 'hour'
+        elif weekday is not None:
+            every = 'weekday'
+        elif day is not None:
+            every = 'month'
         else:
-            # proper alignment of now and alarm_dtime, so return it
-            if (self._utc):
-                return _utc2local(alarm_dtime)
-            else:
-                return alarm_dtime
+            every = 'day'
+        if self._utc and every != 'second':
+            try:
+                dtime = _utc2local(next_recurring(
+                    datetime.utcnow(),every,second,minute,hour,weekday,day))
+            except ValueError:
+                dtime = None                  # invalid register values
+            if dtime is not None:
+                return (every,recurring_fields(every,dtime))
+        fields = dict(second=second,minute=minute,hour=hour,
+                      weekday=weekday,day=day)
+        return (every,dict((f,fields[f]) for f in RECURRING[every][1]))
 
-        # second try: we moved the alarm one month, but the day-of-month
-        # might not be valid for the new month
-        try:
-            alarm_dtime = datetime(year,month,day,hour,min,sec)
-        except ValueError:
-            # again, no year roll-over necessary
-            if fired:
-                month = month - 1      # alarm is in the past, go back in time
-            else:
-                month = month + 1      # alarm waiting, i.e. in the future
-            alarm_dtime = datetime(year,month,day,hour,min,sec)
-
-        if (self._utc):
-          return _utc2local(alarm_dtime)
+    def get_alarm_time(self,alarm,convert=True):
+        """
+        Query the given alarm and return a datetime-object or a tuple
+        (day-of-month,day-of-week,hour,min,sec) depending on the convert
+        flag. The datetime is the next match if the alarm did not fire yet,
+        otherwise the last match (the alarm could also have fired earlier).
+        """
+        if not convert:
+            return _decode_alarm(alarm,
+                      self._read_registers(*self._ALARM_REGISTERS[alarm]))
+
+        # alarm registers and status-register with a single read
+        first = self._ALARM1_SEC_REGISTER
+        regs  = self._read_registers(first,self._STATUS_REGISTER-first+1)
+        (offset,length) = self._ALARM_REGISTERS[alarm]
+        alarm_t = _decode_alarm(alarm,regs[offset-first:offset-first+length])
+
+        import ds3231_alarm
+        now = datetime.utcnow() if self._utc else datetime.now()
+        if regs[-1] & alarm:
+            dtime = ds3231_alarm.prev_match(alarm_t,now)
         else:
-          return alarm_dtime
+            dtime = ds3231_alarm.next_match(alarm_t,now)
+        return _utc2local(dtime) if self._utc else dtime
 
     def get_alarm_state(self,alarm):
         """
         Query if the state of the alarm. Returns a tuple (enabled,fired)
         of two booleans.
         """
-        control = self._read(self._CONTROL_REGISTER)
-        status  = self._read(self._STATUS_REGISTER)
-
+        (control,status) = self._read_registers(self._CONTROL_REGISTER,2)
         return (bool(control & alarm),bool(status & alarm))
     
     def clear_alarm(self,alarm):
         """
         Clear the given alarm (set A1F or A2F in the status-register to zero)
         """
-        status = self._read(self._STATUS_REGISTER)
-        status &= ~alarm
-        self._write(self._STATUS_REGISTER,status)
+        self._update_bits(self._STATUS_REGISTER,~alarm & 0xFF,0x00)
         
     def set_alarm(self,alarm,state):
         """
         Set the given alarm-flag A1IE or A2IE in the control-register to the
         desired state (0 or 1)
         """
-        control = self._read(self._CONTROL_REGISTER)
-        control = _set_bit(control,alarm-1,state)
-        self._write(self._CONTROL_REGISTER,control)
+        mask = 1 << (alarm-1)
+        self._update_bits(self._CONTROL_REGISTER,~mask & 0xFF,
+                          mask if state else 0x00)
+
+    def _alarm_fired(self,alarm):
+        """
+        Read the status-register (only) and check the flag of the alarm.
+        """
+        self._snapshot = None
+        return bool(self._read(self._STATUS_REGISTER) & alarm)
+
+    def wait_for_alarm(self,alarm,timeout=None,edge=None):
+        """
+        Wait until the alarm fires (the flag is not cleared). Returns False
+        after timeout seconds (None: wait forever).
+
+        With an edge source for the INT/SQW-line (see ds3231_edge.py) the
+        call sleeps until the line asserts, which needs INTCN and the
+        alarm enabled. Otherwise the status-register is polled with
+        intervals growing from ALARM_POLL_MIN to ALARM_POLL_MAX.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        interval = ALARM_POLL_MIN
+        while True:
+            if edge is not None:
+                edge.clear()                  # edges before the check
+            if self._alarm_fired(alarm):
+                return True
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            if edge is not None:
+                edge.wait(remaining)
+            else:
+                time.sleep(interval if remaining is None else
+                           min(interval,remaining))
+                interval = min(2*interval,ALARM_POLL_MAX)
+
+    def wait_for_alarm_async(self,alarm,timeout=None,edge=None):
+        """
+        asyncio-variant of wait_for_alarm() (python3 only): returns a future
+        of the result, i.e. use "fired = await rtc.wait_for_alarm_async(1)".
+        All bus-accesses run in the thread of the event-loop.
+        """
+        import asyncio, select
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        deadline = None if timeout is None else loop.time() + timeout
+        state = {'interval': ALARM_POLL_MIN, 'handle': None}
+        readable = edge is not None and edge.events == select.POLLIN
+
+        def cleanup(_future):
+            # also called if the caller cancels the future
+            if readable:
+                loop.remove_reader(edge.fileno())
+            if state['handle']:
+                state['handle'].cancel()
+
+        def check():
+            if future.done():
+                return
+            try:
+                if edge is not None:
+                    edge.clear()
+                fired = self._alarm_fired(alarm)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            remaining = None if deadline is None else deadline - loop.time()
+            if fired or (remaining is not None and remaining <= 0):
+                future.set_result(fired)
+                return
+            if edge is None:
+                delay = state['interval']
+                state['interval'] = min(2*delay,ALARM_POLL_MAX)
+                if remaining is not None:
+                    delay = min(delay,remaining)
+                state['handle'] = loop.call_later(delay,check)
+            elif readable:
+                if remaining is not None and state['handle'] is None:
+                    state['handle'] = loop.call_later(remaining,check)
+            else:
+                # POLLPRI (sysfs) is not supported by the event-loop:
+                # only the poll() runs in a thread
+                loop.run_in_executor(None,edge.wait,remaining).add_done_callback(
+                    lambda _: check())
+
+        future.add_done_callback(cleanup)
+        if readable:
+            loop.add_reader(edge.fileno(),check)
+        check()
+        return future
 
     def dump_value(self,value):
         """
@@ -499,7 +1068,7 @@ class ds3231(object):
         """
         Read and return a raw register as binary string
         """
-        return self.dump_value(self._read(reg))
+        return self.dump_value(self._read_registers(reg,1)[0])
     
     ###########################
     # SDL_DS3231 module onboard temperature sensor
@@ -507,37 +1076,152 @@ class ds3231(object):
 
     def get_temp(self):
         """
-        ???
+        Return the temperature in degrees Celsius.
+        """
+        return _decode_temp(*self._read_registers(self._TEMP_MSB_REGISTER,2))
+
+    def trigger_conversion(self,poll=CONV_POLL,timeout=CONV_TIMEOUT):
         """
-        byte_tmsb = self._bus.read_byte_data(self._addr, self._TEMP_MSB_REGISTER)
-        byte_tlsb = bin(self._bus.read_byte_data(self._addr,
-                                            self._TEMP_LSB_REGISTER))[2:].zfill(8)
-        return byte_tmsb + int(byte_tlsb[0]) * 2 ** (-1) + int(byte_tlsb[1]) * 2 ** (-2)
+        Force a temperature conversion (the DS3231 converts only every 64
+        seconds) and wait until it is finished. Returns the new temperature.
+
+        Control, status, aging and temperature registers are polled with a
+        single read (in burst mode), so the last poll also returns the
+        temperature. A running conversion (BSY) is awaited before CONV is
+        set. Every poll allocates the list of registers returned by the
+        transport.
+        """
+        if self._batch is not None:
+            raise ValueError("no conversion within a transaction")
+        self._snapshot = None
+        first = self._CONTROL_REGISTER
+        length = self._TEMP_LSB_REGISTER - first + 1
+        deadline = time.time() + timeout
+        regs = self._read_registers(first,length)
+        while regs[1] & 0x04:                          # BSY
+            if time.time() > deadline:
+                raise IOError("temperature conversion does not finish")
+            time.sleep(poll)
+            regs = self._read_registers(first,length)
+        self._write_registers(first,[regs[0] | 0x20])  # CONV
+        while True:
+            time.sleep(poll)
+            regs = self._read_registers(first,length)
+            if not regs[0] & 0x20 and not regs[1] & 0x04:
+                return _decode_temp(regs[3],regs[4])
+            elif time.time() > deadline:
+                raise IOError("temperature conversion does not finish")
+
+    def get_oscillator_stopped(self):
+        """
+        Return the oscillator-stop flag (OSF): the oscillator stopped at
+        least once since the flag was cleared (e.g. power loss without
+        battery), so the time is probably invalid.
+        """
+        return bool(self._read_registers(self._STATUS_REGISTER,1)[0] & 0x80)
+
+    def get_aging_offset(self):
+        """
+        Return the aging offset (-128..127). One step changes the frequency
+        of the oscillator by about 0.1ppm (at 25 degrees Celsius), positive
+        values slow down the clock.
+        """
+        value = self._read_registers(self._AGING_REGISTER,1)[0]
+        return value - 256 if value & 0x80 else value
+
+    def set_aging_offset(self,value):
+        """
+        Write the aging offset (-128..127) and force a temperature
+        conversion, which applies the new value to the oscillator. Within
+        a transaction, the conversion is only started (CONV).
+        """
+        if value < -128 or value > 127:
+            raise ValueError('Aging offset is out of range [-128,127].')
+        if self._batch is not None:
+            self._write(self._AGING_REGISTER,value & 0xFF)
+            self._update_bits(self._CONTROL_REGISTER,0xFF,0x20)   # CONV
+        else:
+            self._write_registers(self._AGING_REGISTER,[value & 0xFF])
+            self.trigger_conversion()
 
     ###########################
     # AT24C32 non-volatile ram Code
     ###########################
 
+    def _check_at24c32_range(self, address, length):
+        """
+        Check address and length against the size of the AT24C32
+        """
+        if address < 0 or length < 0 or address + length > AT24C32_SIZE:
+            raise ValueError('Address is out of range [0,%d].' % (AT24C32_SIZE-1))
+
+    def _wait_at24c32(self):
+        """
+        Wait for the end of the internal write cycle of the AT24C32:
+        the chip does not acknowledge its address while it is busy
+        (ACK polling).
+        """
+        deadline = time.time() + AT24C32_WRITE_TIMEOUT
+        while True:
+            try:
+                self._bus("eeprom_poll",self._transport.probe,
+                          self._at24c32_addr)
+                return
+            except IOError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(AT24C32_POLL_INTERVAL)
+
     def set_current_at24c32_address(self, address):
         """
-        ???
+        Set the address-pointer of the AT24C32.
+        """
+        self._bus("eeprom_write",self._transport.write,
+                  self._at24c32_addr,[address >> 8, address & 0xFF])
+
+    def read_at24c32(self, address, length):
+        """
+        Read length bytes starting at address with a sequential read (a
+        single transaction with the i2cdev-transport). Returns a bytearray.
+        """
+        self._check_at24c32_range(address,length)
+        if not length:
+            return bytearray()
+        return bytearray(self._bus("eeprom_read",self._transport.write_read,
+                                   self._at24c32_addr,
+                                   [address >> 8, address & 0xFF],length))
+
+    def write_at24c32(self, address, data):
         """
-        addr1 = address / 256
-        addr0 = address % 256
-        self._bus.write_i2c_block_data(self._at24c32_addr, addr1, [addr0])
+        Write data (bytes, bytearray, memoryview or a list of integers)
+        starting at address. The data is split along the page boundaries
+        (and the block limit of the transport) into block writes, after
+        every write the method waits for the end of the write-cycle.
+        """
+        data = bytearray(data)
+        self._check_at24c32_range(address,len(data))
+        chunk = AT24C32_PAGE_SIZE
+        if self._transport.max_block:
+            chunk = min(chunk,self._transport.max_block-2)
+        pos = 0
+        while pos < len(data):
+            page_left = AT24C32_PAGE_SIZE - (address % AT24C32_PAGE_SIZE)
+            count = min(page_left,chunk,len(data)-pos)
+            self._bus("eeprom_write",self._transport.write,
+                      self._at24c32_addr,
+                      [address >> 8, address & 0xFF] + list(data[pos:pos+count]))
+            self._wait_at24c32()
+            address += count
+            pos += count
 
     def read_at24c32_byte(self, address):
         """
-        ???
+        Read a single byte.
         """
-        self.set_current_at24c32_address(address)
-        return self._bus.read_byte(self._at24c32_addr)
+        return self.read_at24c32(address,1)[0]
 
     def write_at24c32_byte(self, address, value):
         """
-        ???
+        Write a single byte.
         """
-        addr1 = address / 256
-        addr0 = address % 256
-        self._bus.write_i2c_block_data(self._at24c32_addr, addr1, [addr0, value])
-        time.sleep(0.20)
+        self.write_at24c32(address,[value])
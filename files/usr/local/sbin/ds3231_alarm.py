@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Occurrences of DS3231 alarms (no hardware access).
+#
+# An alarm is given as the tuple returned by ds3231.ds3231.get_alarm_time()
+# with convert=False: (day-of-month,day-of-week,hour,min,sec) where None
+# means "don't care" (mask bit set). day-of-week is the value of the DOW
+# register, i.e. 1=monday ... 7=sunday. All datetimes are naive and in
+# the time of the RTC.
+#
+# The next (previous) match is computed directly: the time of day is the
+# smallest (largest) matching (hour,min,sec) not before (after) the
+# reference, the day follows from the day-of-week or day-of-month. Only
+# day-of-month alarms may skip months (at most two, e.g. day 31).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import calendar
+from datetime import datetime, timedelta
+
+_LIMITS = (23,59,59)                      # hour, min, sec
+_SECOND = timedelta(seconds=1)
+_DAY    = timedelta(days=1)
+
+def _check(alarm_t):
+    (day,weekday,hour,minute,second) = alarm_t
+    if day is not None and not 1 <= day <= 31:
+        raise ValueError("invalid day-of-month: %r" % day)
+    if weekday is not None and not 1 <= weekday <= 7:
+        raise ValueError("invalid day-of-week: %r" % weekday)
+    for value,limit in zip((hour,minute,second),_LIMITS):
+        if value is not None and not 0 <= value <= limit:
+            raise ValueError("invalid time: %r" % (alarm_t,))
+
+def _next_fields(start,fields,limits=_LIMITS):
+    """
+    Return the smallest tuple >= start matching fields (None: any value),
+    or None if there is no such tuple.
+    """
+    if not fields:
+        return ()
+    (value,field,limit) = (start[0],fields[0],limits[0])
+    if field is None or field == value:
+        rest = _next_fields(start[1:],fields[1:],limits[1:])
+        if rest is not None:
+            return (value,) + rest
+        value = value + 1 if field is None and value < limit else None
+    else:
+        value = field if field > value else None
+    if value is None:
+        return None
+    return (value,) + tuple(0 if f is None else f for f in fields[1:])
+
+def _prev_fields(start,fields,limits=_LIMITS):
+    """
+    Return the largest tuple <= start matching fields (None: any value),
+    or None if there is no such tuple.
+    """
+    if not fields:
+        return ()
+    (value,field) = (start[0],fields[0])
+    if field is None or field == value:
+        rest = _prev_fields(start[1:],fields[1:],limits[1:])
+        if rest is not None:
+            return (value,) + rest
+        value = value - 1 if field is None and value > 0 else None
+    else:
+        value = field if field < value else None
+    if value is None:
+        return None
+    return (value,) + tuple(l if f is None else f
+                            for f,l in zip(fields[1:],limits[1:]))
+
+def _at(date,tod):
+    return datetime(date.year,date.month,date.day,*tod)
+
+def matches(alarm_t,dtime):
+    """
+    Check if the alarm matches the given datetime (ignoring microseconds)
+    """
+    (day,weekday,hour,minute,second) = alarm_t
+    return ((day is None or dtime.day == day) and
+            (weekday is None or dtime.isoweekday() == weekday) and
+            (hour is None or dtime.hour == hour) and
+            (minute is None or dtime.minute == minute) and
+            (second is None or dtime.second == second))
+
+def next_match(alarm_t,after):
+    """
+    Return the first datetime after the given datetime matching the alarm
+    """
+    _check(alarm_t)
+    (day,weekday) = alarm_t[:2]
+    fields = alarm_t[2:]
+    start  = after.replace(microsecond=0) + _SECOND
+    first  = _next_fields((start.hour,start.minute,start.second),fields)
+    tod    = _next_fields((0,0,0),fields)      # on any later day
+
+    if day is not None:
+        (year,month) = (start.year,start.month)
+        if start.day == day and first is not None:
+            return _at(start,first)
+        elif start.day < day <= calendar.monthrange(year,month)[1]:
+            return datetime(year,month,day,*tod)
+        while True:                            # skip months without day
+            (year,month) = (year+1,1) if month == 12 else (year,month+1)
+            if day <= calendar.monthrange(year,month)[1]:
+                return datetime(year,month,day,*tod)
+    elif weekday is not None:
+        days = (weekday - start.isoweekday()) % 7
+        if days == 0 and first is not None:
+            return _at(start,first)
+        return _at(start + timedelta(days=days or 7),tod)
+    elif first is not None:
+        return _at(start,first)
+    return _at(start + _DAY,tod)
+
+def prev_match(alarm_t,before):
+    """
+    Return the last datetime not after the given datetime matching the alarm
+    """
+    _check(alarm_t)
+    (day,weekday) = alarm_t[:2]
+    fields = alarm_t[2:]
+    end  = before.replace(microsecond=0)
+    last = _prev_fields((end.hour,end.minute,end.second),fields)
+    tod  = _prev_fields(_LIMITS,fields)        # on any earlier day
+
+    if day is not None:
+        (year,month) = (end.year,end.month)
+        if end.day == day and last is not None:
+            return _at(end,last)
+        elif end.day > day:
+            return datetime(year,month,day,*tod)
+        while True:                            # skip months without day
+            (year,month) = (year-1,12) if month == 1 else (year,month-1)
+            if day <= calendar.monthrange(year,month)[1]:
+                return datetime(year,month,day,*tod)
+    elif weekday is not None:
+        days = (end.isoweekday() - weekday) % 7
+        if days == 0 and last is not None:
+            return _at(end,last)
+        return _at(end - timedelta(days=days or 7),tod)
+    elif last is not None:
+        return _at(end,last)
+    return _at(end - _DAY,tod)
+
+def occurrences(alarm_t,after,count=None):
+    """
+    Generate the next count (None: all) datetimes after the given datetime
+    matching the alarm
+    """
+    dtime = after
+    while count is None or count > 0:
+        dtime = next_match(alarm_t,dtime)
+        yield dtime
+        if count is not None:
+            count -= 1
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Table-driven BCD codec for the registers of the RTC DS3231.
+#
+# All conversions are simple lookups in precomputed tables and always
+# return integers.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+# decode-table: all 256 byte values (invalid nibbles are decoded
+# arithmetically, like the original bit-loop did)
+DECODE = tuple((b >> 4)*10 + (b & 0x0F) for b in range(256))
+
+# encode-table: numbers 0-99
+ENCODE = tuple(((n // 10) << 4) | (n % 10) for n in range(100))
+
+# masks applied before decoding the registers 0x00-0x12. A value of None
+# marks a register which is not BCD-encoded and returned as is
+REGISTER_MASKS = (
+    0x7F,                  # 0x00 seconds (oscillator bit)
+    0xFF,                  # 0x01 minutes
+    0x3F,                  # 0x02 hours (12/24 bit)
+    0xFF,                  # 0x03 day of week
+    0xFF,                  # 0x04 day of month
+    0x1F,                  # 0x05 month (century bit)
+    0xFF,                  # 0x06 year
+    0x7F,                  # 0x07 alarm1 seconds (A1M1)
+    0x7F,                  # 0x08 alarm1 minutes (A1M2)
+    0x3F,                  # 0x09 alarm1 hours   (A1M3, 12/24)
+    0x3F,                  # 0x0A alarm1 date    (A1M4, DY/DT)
+    0x7F,                  # 0x0B alarm2 minutes (A2M2)
+    0x3F,                  # 0x0C alarm2 hours   (A2M3, 12/24)
+    0x3F,                  # 0x0D alarm2 date    (A2M4, DY/DT)
+    None,                  # 0x0E control
+    None,                  # 0x0F status
+    None,                  # 0x10 aging offset
+    None,                  # 0x11 temperature MSB
+    None                   # 0x12 temperature LSB
+    )
+
+_HOURS_REGISTER = 0x02
+
+def bcd_to_int(bcd):
+    """
+    Decode a 2x4bit BCD to an integer. Raises ValueError if bcd is not
+    a byte value (0-255).
+    """
+    if 0 <= bcd < 256:
+        return DECODE[bcd]
+    raise ValueError("BCD value out of range [0,255]: %r" % (bcd,))
+
+def int_to_bcd(number):
+    """
+    Encode a one or two digits number to the BCD format. Raises ValueError
+    for numbers outside 0-99 (negative indices would silently wrap).
+    """
+    if 0 <= number < 100:
+        return ENCODE[number]
+    raise ValueError("number out of range [0,99]: %r" % (number,))
+
+def decode_block(regs,start=0):
+    """
+    Decode a block of raw register values starting at register start.
+    BCD-registers are masked and decoded, all other registers are
+    returned unchanged. Returns a list of integers.
+    """
+    out = [DECODE[v & m] if m is not None else v
+           for v,m in zip(regs,REGISTER_MASKS[start:start+len(regs)])]
+    # some modules return 0x64 for midnight
+    if start <= _HOURS_REGISTER < start+len(regs) and (
+            regs[_HOURS_REGISTER-start] == 0x64):
+        out[_HOURS_REGISTER-start] = 0
+    return out
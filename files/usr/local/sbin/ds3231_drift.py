@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Drift measurement and calibration of the aging offset of the DS3231.
+#
+# A sample is the offset of the RTC to the (synchronized) system time,
+# measured at the tick of the seconds-register, together with the
+# temperature and the aging offset. Samples are appended to a compact
+# binary history (16 bytes per sample, at most MAX_SAMPLES).
+#
+# The drift is the slope of the offsets over time. Samples are split into
+# segments whenever the RTC was set (flag SET, or a jump of the offset) or
+# the aging offset changed, and all segments of the current aging offset
+# are fitted with one slope (least squares, one intercept per segment).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, struct
+from collections import namedtuple
+from datetime import datetime
+
+HISTORY_FILE = "/var/lib/wake-on-rtc.drift"
+MAX_SAMPLES  = 1024         # samples kept in the history
+MIN_SPAN     = 86400        # seconds of history needed for a fit
+AGING_PPM    = 0.1          # ppm per step of the aging offset
+MAX_PPM      = 100          # larger changes of the offset: the RTC was set
+
+SET = 0x01                  # flag: the RTC was set before the sample
+
+TIME_ERROR = 5              # adjtimex(2): clock not synchronized
+
+_RECORD = struct.Struct("<dfhbB")   # time,offset,temp (1/100 C),aging,flags
+
+sample  = namedtuple('sample',['time','offset','temp','aging','flags'])
+drift_fit = namedtuple('drift_fit',['ppm','span','count','segments','temp',
+                                    'aging'])
+
+def is_synchronized():
+    """
+    Check if the system time is synchronized (e.g. by NTP) using
+    adjtimex(2). Returns None if this is unknown.
+    """
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6")
+        timex = ctypes.create_string_buffer(1024)   # modes=0: query only
+        state = libc.adjtimex(timex)
+    except (OSError,AttributeError):
+        return None
+    return state not in (-1,TIME_ERROR)
+
+def measure(rtc,flags=0):
+    """
+    Measure the offset (seconds) of the RTC to the system time and return
+    a sample
+    """
+    (dtime,stamp) = rtc.read_datetime_tick()
+    delta = dtime - datetime.fromtimestamp(stamp)
+    offset = delta.days*86400 + delta.seconds + delta.microseconds/1e6
+    return sample(stamp,offset,rtc.get_temp(),rtc.get_aging_offset(),flags)
+
+class history(object):
+    """
+    Drift history in a file.
+    """
+
+    def __init__(self,path=HISTORY_FILE,max_samples=MAX_SAMPLES):
+        self.path = path
+        self.max_samples = max_samples
+
+    def samples(self):
+        """ return all samples (oldest first) """
+        try:
+            with open(self.path,"rb") as f:
+                data = f.read()
+        except (IOError,OSError):
+            return []
+        size = _RECORD.size
+        return [self._unpack(data[pos:pos+size])
+                for pos in range(0,len(data) - len(data) % size,size)]
+
+    def _unpack(self,data):
+        (stamp,offset,temp,aging,flags) = _RECORD.unpack(data)
+        return sample(stamp,offset,temp/100.0,aging,flags)
+
+    def _pack(self,s):
+        return _RECORD.pack(s.time,s.offset,int(round(s.temp*100)),s.aging,
+                            s.flags)
+
+    def append(self,s):
+        """
+        Append a sample. The history is truncated to max_samples if it
+        grew to twice the size (atomically).
+        """
+        with open(self.path,"ab") as f:
+            f.write(self._pack(s))
+            size = f.tell()
+        if size >= 2*self.max_samples*_RECORD.size:
+            samples = self.samples()[-self.max_samples:]
+            tmp = self.path + ".tmp"
+            with open(tmp,"wb") as f:
+                f.write(b"".join(self._pack(s) for s in samples))
+            os.rename(tmp,self.path)
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def _jump(prev,s):
+    """ check if the RTC was set between two samples (without flag SET) """
+    return (abs(s.offset - prev.offset) >
+            MAX_PPM*1e-6*abs(s.time - prev.time) + 0.5)
+
+def segments(samples):
+    """
+    Split the samples into segments without setting the RTC or changing
+    the aging offset
+    """
+    result = []
+    for s in samples:
+        if (not result or s.flags & SET or s.aging != result[-1][-1].aging or
+            _jump(result[-1][-1],s)):
+            result.append([s])
+        else:
+            result[-1].append(s)
+    return result
+
+def fit(samples):
+    """
+    Fit the drift of the samples with the aging offset of the last sample.
+    Returns a drift_fit (ppm > 0: the RTC is fast) or None if the history
+    spans less than MIN_SPAN seconds.
+    """
+    if not samples:
+        return None
+    aging = samples[-1].aging
+    used = [seg for seg in segments(samples)
+            if len(seg) > 1 and seg[0].aging == aging]
+    span = sum(seg[-1].time - seg[0].time for seg in used)
+    if span < MIN_SPAN:
+        return None
+    (sxx,sxy,temp,count) = (0.0,0.0,0.0,0)
+    for seg in used:
+        t0 = sum(s.time for s in seg)/len(seg)
+        o0 = sum(s.offset for s in seg)/len(seg)
+        sxx += sum((s.time - t0)**2 for s in seg)
+        sxy += sum((s.time - t0)*(s.offset - o0) for s in seg)
+        temp  += sum(s.temp for s in seg)
+        count += len(seg)
+    return drift_fit(1e6*sxy/sxx,span,count,len(used),temp/count,aging)
+
+def aging_offset(result):
+    """
+    Return the aging offset compensating the fitted drift
+    """
+    value = int(round(result.aging + result.ppm/AGING_PPM))
+    return max(-128,min(127,value))
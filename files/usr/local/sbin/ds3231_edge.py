@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Edge sources for ds3231.wait_for_alarm(): file descriptors which become
+# ready when the INT/SQW-line of the DS3231 asserts (falling edge).
+#
+#   sysfs:N         - GPIO N through /sys/class/gpio (poll for POLLPRI)
+#   gpiochipM:N     - line N of /dev/gpiochipM (GPIO character-device)
+#   pipe            - a pipe, trigger() simulates an edge (for tests)
+#   eventfd         - an eventfd (python 3.10+), trigger() simulates an edge
+#
+# Usage:
+#   import ds3231, ds3231_edge
+#   edge = ds3231_edge.get_edge_source("gpiochip0:17")
+#   rtc.wait_for_alarm(1,timeout=60,edge=edge)
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, errno, select, fcntl, struct
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd,fcntl.F_GETFL)
+    fcntl.fcntl(fd,fcntl.F_SETFL,flags | os.O_NONBLOCK)
+
+class edge_source(object):
+    """
+    Base class of all edge sources. An edge source is ready (in the sense
+    of poll()) after an edge, until clear() is called.
+    """
+
+    events = select.POLLIN             # poll-events signaling an edge
+
+    def __init__(self,fd):
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def clear(self):
+        """
+        Consume all pending edges (non-blocking).
+        """
+        try:
+            while os.read(self._fd,64):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def wait(self,timeout=None):
+        """
+        Wait for an edge. Returns False on timeout (seconds, None: forever).
+        """
+        poller = select.poll()
+        poller.register(self._fd,self.events)
+        if timeout is not None:
+            timeout = max(0,int(timeout*1000))
+        return bool(poller.poll(timeout))
+
+    def close(self):
+        os.close(self._fd)
+
+class sysfs_edge(edge_source):
+    """
+    GPIO through the (deprecated) sysfs-interface. The value-file signals
+    an edge with POLLPRI.
+    """
+
+    events = select.POLLPRI | select.POLLERR
+
+    def __init__(self,gpio,edge="falling"):
+        base = "/sys/class/gpio/gpio%d" % gpio
+        if not os.path.exists(base):
+            with open("/sys/class/gpio/export","w") as f:
+                f.write(str(gpio))
+        with open(base+"/direction","w") as f:
+            f.write("in")
+        with open(base+"/edge","w") as f:
+            f.write(edge)
+        super(sysfs_edge,self).__init__(os.open(base+"/value",os.O_RDONLY))
+
+    def clear(self):
+        os.lseek(self._fd,0,os.SEEK_SET)
+        os.read(self._fd,8)
+
+class chardev_edge(edge_source):
+    """
+    GPIO line of a GPIO character-device (ABI v1 line events). Every
+    edge is a 16-byte event readable from the line-fd.
+    """
+
+    _GPIO_GET_LINEEVENT_IOCTL       = 0xC030B404
+    _GPIOHANDLE_REQUEST_INPUT       = 0x01
+    _GPIOEVENT_REQUEST_FALLING_EDGE = 0x02
+    _REQUEST = struct.Struct("<III32si")   # struct gpioevent_request
+
+    def __init__(self,line,chip="/dev/gpiochip0"):
+        req = bytearray(self._REQUEST.pack(line,self._GPIOHANDLE_REQUEST_INPUT,
+                                           self._GPIOEVENT_REQUEST_FALLING_EDGE,
+                                           b"ds3231",-1))
+        chip_fd = os.open(chip,os.O_RDONLY)
+        try:
+            fcntl.ioctl(chip_fd,self._GPIO_GET_LINEEVENT_IOCTL,req,True)
+        finally:
+            os.close(chip_fd)
+        fd = self._REQUEST.unpack_from(bytes(req))[4]
+        _set_nonblocking(fd)
+        super(chardev_edge,self).__init__(fd)
+
+class pipe_edge(edge_source):
+    """
+    Pipe standing in for the INT/SQW-line.
+    """
+
+    def __init__(self):
+        (fd,self._wfd) = os.pipe()
+        _set_nonblocking(fd)
+        super(pipe_edge,self).__init__(fd)
+
+    def trigger(self):
+        """ simulate an edge """
+        os.write(self._wfd,b'\x00')
+
+    def close(self):
+        super(pipe_edge,self).close()
+        os.close(self._wfd)
+
+class eventfd_edge(edge_source):
+    """
+    eventfd standing in for the INT/SQW-line (needs python 3.10+).
+    """
+
+    def __init__(self):
+        super(eventfd_edge,self).__init__(os.eventfd(0,os.EFD_NONBLOCK))
+
+    def trigger(self):
+        """ simulate an edge """
+        os.eventfd_write(self._fd,1)
+
+def get_edge_source(spec):
+    """
+    Create an edge source from a specification string: sysfs:N,
+    gpiochipM:N, pipe or eventfd. Objects and None are returned as is.
+    """
+    if spec is None or not isinstance(spec,str):
+        return spec
+    (name,_,arg) = spec.partition(':')
+    if name == 'sysfs':
+        return sysfs_edge(int(arg))
+    elif name.startswith('gpiochip'):
+        return chardev_edge(int(arg),"/dev/"+name)
+    elif name == 'pipe':
+        return pipe_edge()
+    elif name == 'eventfd':
+        return eventfd_edge()
+    else:
+        raise ValueError("unsupported edge source: %s" % spec)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Lock of the i2c-bus shared by the rtc daemon and wake-on-rtc.py.
+#
+# The lock is a flock(2) on LOCK_FILE, so it is released by the kernel
+# when the holder exits. The file also holds a generation counter which
+# every holder increments on release: a holder caching registers (the
+# rtc daemon) checks `changed` after acquire() and drops its snapshot
+# if somebody else held the lock in the meantime.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, time, fcntl, errno
+
+LOCK_FILE = "/run/ds3231.lock"
+TIMEOUT   = 10.0            # seconds to wait for the lock
+POLL      = 0.01            # seconds between two attempts
+
+class bus_lock(object):
+    """
+    Exclusive lock of the bus (also a context manager). acquire() returns
+    False if the lock is not available within the timeout (a with-block
+    then runs without the lock, see locked).
+    """
+
+    def __init__(self,path=LOCK_FILE,timeout=TIMEOUT):
+        self.path    = path
+        self.timeout = timeout
+        self.locked  = False
+        self.changed = True         # another holder since our last release
+        self._fd     = None
+        self._gen    = None
+
+    def _read_gen(self):
+        os.lseek(self._fd,0,os.SEEK_SET)
+        try:
+            return int(os.read(self._fd,32) or 0)
+        except ValueError:
+            return 0
+
+    def acquire(self):
+        """ acquire the lock, returns False after a timeout """
+        if self._fd is None:
+            self._fd = os.open(self.path,os.O_RDWR|os.O_CREAT,0o644)
+            fcntl.fcntl(self._fd,fcntl.F_SETFD,fcntl.FD_CLOEXEC)  # hooks
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self._fd,fcntl.LOCK_EX|fcntl.LOCK_NB)
+                break
+            except (IOError,OSError) as e:
+                if e.errno not in (errno.EAGAIN,errno.EACCES):
+                    raise
+                if time.time() > deadline:
+                    return False
+                time.sleep(POLL)
+        self.locked  = True
+        gen = self._read_gen()
+        self.changed = gen != self._gen
+        self._gen    = gen
+        return True
+
+    def release(self):
+        """ increment the generation and release the lock """
+        if not self.locked:
+            return
+        self._gen = self._read_gen() + 1
+        os.lseek(self._fd,0,os.SEEK_SET)
+        os.ftruncate(self._fd,0)
+        os.write(self._fd,("%d\n" % self._gen).encode('ascii'))
+        fcntl.flock(self._fd,fcntl.LOCK_UN)
+        self.locked = False
+
+    def close(self):
+        self.release()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.release()
+        return False
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Server and client of the rtc daemon (see /usr/local/sbin/rtcd).
+#
+# The daemon keeps the i2c-bus open and serves the methods of the ds3231
+# driver over a Unix socket. It handles one connection at a time, so the
+# read-modify-writes of different callers never interleave. Reads are
+# served from a register snapshot which is reused for MAX_AGE seconds.
+# With a bus lock (see ds3231_lock.py), every request (or transaction)
+# holds the lock shared with wake-on-rtc.py, and the snapshot is dropped
+# if the lock was held by somebody else in the meantime.
+#
+# Protocol: one line per request and per response (utf-8)
+#   request:  method json-list-of-arguments
+#   response: +json-result
+#             -exception-type message
+# datetimes are encoded as {"$dt": "YYYY-mm-dd HH:MM:SS.ffffff"},
+# bytearrays as {"$hex": "..."}.
+#
+# Besides the public methods of the driver, the server knows:
+#   begin [verify]    start a transaction (see ds3231.transaction())
+#   end [commit]      end the innermost transaction
+#   snapshot [refresh] refresh the cached snapshot
+#   transactions      number of bus transactions of the daemon
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, socket, json, time, binascii
+from datetime import datetime
+
+import ds3231
+
+SOCKET_PATH = "/run/rtcd.sock"
+MAX_AGE     = 0.25          # seconds a snapshot serves reads
+TIMEOUT     = 5.0           # seconds, idle clients are disconnected
+LOCK_TIMEOUT = 4.0          # seconds to wait for the bus lock (< TIMEOUT)
+
+# methods which must not block the daemon
+LOCAL_METHODS = frozenset(["transaction","wait_for_alarm",
+                           "wait_for_alarm_async"])
+
+# methods served from the cached snapshot
+READ_METHODS = frozenset(["read_all","read_str","read_datetime",
+                          "get_alarm_time","get_alarm_recurring",
+                          "get_alarm_state",
+                          "dump_value","dump_register","get_temp",
+                          "get_aging_offset","get_oscillator_stopped",
+                          "read_timestamp"])
+
+_DT_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def _encode(value):
+    """ convert a value to something json can serialize """
+    if isinstance(value,datetime):
+        return {"$dt": value.strftime(_DT_FORMAT)}
+    elif isinstance(value,(bytearray,memoryview)):
+        return {"$hex": binascii.hexlify(bytes(value)).decode('ascii')}
+    elif isinstance(value,(list,tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+def _decode(value):
+    """ inverse of _encode() """
+    if isinstance(value,dict):
+        if "$dt" in value:
+            return datetime.strptime(value["$dt"],_DT_FORMAT)
+        elif "$hex" in value:
+            return bytearray(binascii.unhexlify(value["$hex"]))
+    elif isinstance(value,list):
+        return [_decode(v) for v in value]
+    return value
+
+def format_request(method,args):
+    return ("%s %s\n" % (method,json.dumps(_encode(list(args))))).encode('utf-8')
+
+def parse_request(line):
+    (method,_,args) = line.decode('utf-8').strip().partition(' ')
+    return (method,_decode(json.loads(args)) if args else [])
+
+def format_response(result=None,error=None):
+    if error is not None:
+        msg = str(error).replace('\n',' ')
+        return ("-%s %s\n" % (type(error).__name__,msg)).encode('utf-8')
+    return ("+%s\n" % json.dumps(_encode(result))).encode('utf-8')
+
+def parse_response(line):
+    """
+    Return the result of a response, or raise the error. ValueErrors are
+    raised as such, all other errors as IOError.
+    """
+    line = line.decode('utf-8').rstrip('\n')
+    if line.startswith('+'):
+        return _decode(json.loads(line[1:]))
+    (name,_,msg) = line[1:].partition(' ')
+    if name == 'ValueError':
+        raise ValueError(msg)
+    raise IOError("rtcd: %s: %s" % (name,msg))
+
+class server(object):
+    """
+    Serve a ds3231-object on a Unix socket.
+    """
+
+    def __init__(self,rtc,path=SOCKET_PATH,max_age=MAX_AGE,timeout=TIMEOUT,
+                 lock=None):
+        self.rtc      = rtc
+        self.path     = path
+        self.max_age  = max_age
+        self.timeout  = timeout
+        self.lock     = lock            # a ds3231_lock.bus_lock or None
+        self._snap_time = 0
+        self._sock    = None
+
+    def listen(self):
+        """ create the socket (replacing a stale one) """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path,0o660)
+        self._sock.listen(8)
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def serve_forever(self):
+        """ accept and handle connections, one at a time """
+        if not self._sock:
+            self.listen()
+        while self._sock:
+            try:
+                (conn,_) = self._sock.accept()
+            except socket.error:
+                if not self._sock:               # closed by a signal-handler
+                    break
+                raise
+            try:
+                self.handle(conn)
+            finally:
+                conn.close()
+
+    def handle(self,conn):
+        """
+        Handle all requests of a connection. Transactions still open when
+        the client disconnects are discarded.
+        """
+        conn.settimeout(self.timeout)
+        rfile = conn.makefile('rb')
+        batches = []
+        try:
+            while True:
+                line = rfile.readline()      # no read-ahead (python2)
+                if not line:
+                    break
+                conn.sendall(self.dispatch(line,batches))
+        except socket.error:
+            pass                                  # client vanished or idle
+        finally:
+            while batches:
+                batches.pop().__exit__(ValueError,ValueError("aborted"),None)
+            if self.lock:
+                self.lock.release()
+            rfile.close()
+
+    def _lock(self):
+        """ acquire the bus lock (if not yet held) """
+        if self.lock is None or self.lock.locked:
+            return
+        if not self.lock.acquire():
+            raise IOError("bus is locked")
+        if self.lock.changed:
+            self.rtc.invalidate()
+
+    def _expire(self):
+        """ drop a snapshot older than max_age """
+        if time.time() - self._snap_time > self.max_age:
+            self.rtc.invalidate()
+
+    def _cached(self):
+        """ make sure a snapshot not older than max_age is cached """
+        if self.rtc._snapshot is None:
+            self.rtc.snapshot()
+            self._snap_time = time.time()
+
+    def dispatch(self,line,batches):
+        """ execute a single request and return the response """
+        try:
+            (method,args) = parse_request(line)
+            self._lock()
+            self._expire()
+            if method == "begin":
+                batch = self.rtc.transaction(*args)
+                batch.__enter__()
+                batches.append(batch)
+                result = None
+            elif method == "end":
+                batch = batches.pop()
+                if not args or args[0]:
+                    batch.__exit__(None,None,None)
+                else:
+                    batch.__exit__(ValueError,ValueError("aborted"),None)
+                result = None
+            elif method == "snapshot":
+                if args and args[0]:
+                    self.rtc.invalidate()
+                self._cached()
+                result = None
+            elif method == "transactions":
+                result = self.rtc.transactions
+            elif method.startswith('_') or method in LOCAL_METHODS:
+                raise ValueError("unsupported method: %s" % method)
+            else:
+                func = getattr(self.rtc,method,None)
+                if not callable(func):
+                    raise ValueError("unsupported method: %s" % method)
+                if method in READ_METHODS and not batches:
+                    self._cached()
+                result = func(*args)
+            return format_response(result)
+        except Exception as e:
+            return format_response(error=e)
+        finally:
+            if self.lock and not batches:
+                self.lock.release()         # a transaction keeps the lock
+
+class _remote_batch(object):
+    """ transaction within the daemon """
+
+    def __init__(self,client,verify):
+        self._client = client
+        self._verify = verify
+
+    def __enter__(self):
+        self._client._call("begin",self._verify)
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self._client._call("end",exc_type is None)
+        return False
+
+class client(object):
+    """
+    Proxy for a ds3231-object served by the daemon. All public methods of
+    the driver are available. Raises socket.error if the daemon is not
+    running.
+    """
+
+    def __init__(self,path=SOCKET_PATH,timeout=TIMEOUT):
+        self._sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(path)
+        except socket.error:
+            self._sock.close()
+            raise
+        self._rfile = self._sock.makefile('rb')
+        self._base  = self._call("transactions")
+
+    def _call(self,method,*args):
+        self._sock.sendall(format_request(method,args))
+        line = self._rfile.readline()
+        if not line:
+            raise IOError("rtcd: connection closed")
+        return parse_response(line)
+
+    def __getattr__(self,name):
+        if name.startswith('_'):
+            if name[1:].isupper():
+                return getattr(ds3231.ds3231,name)   # register constants
+            raise AttributeError(name)
+        return lambda *args: self._call(name,*args)
+
+    @property
+    def transactions(self):
+        """ number of bus transactions of the daemon for this client """
+        return self._call("transactions") - self._base
+
+    def transaction(self,verify=False):
+        return _remote_batch(self,verify)
+
+    def snapshot(self,refresh=False):
+        self._call("snapshot",refresh)
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
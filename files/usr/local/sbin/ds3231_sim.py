@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Simulated DS3231 and AT24C32 for tests and benchmarks on machines
+# without i2c-hardware.
+#
+# The DS3231 keeps time (based on a clock-function, by default the
+# system-time), matches both alarms including all mask-modes and sets the
+# alarm-flags. A forced temperature conversion (CONV) keeps CONV and BSY
+# set for the conversion time. The AT24C32 has 32-byte pages and a
+# write-cycle during which it does not acknowledge.
+#
+# Usage:
+#   import ds3231
+#   rtc = ds3231.ds3231(transport="sim")
+#   rtc = ds3231.ds3231(transport="sim:/tmp/rtc-state.json")
+#
+# With a state-file, the state of both chips survives the process, so
+# e.g. multiple calls of rtcctl work as expected.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import time, errno, json, binascii
+from datetime import datetime, timedelta
+
+import ds3231, ds3231_bcd as bcd
+from ds3231_transport import transport
+
+_EPOCH = datetime(1970,1,1)
+
+def _nak():
+    """
+    Return the error raised by the i2c-layer if a device does not acknowledge.
+    """
+    return IOError(errno.EREMOTEIO,"Remote I/O error")
+
+class ds3231_device(object):
+    """
+    Simulated DS3231 (registers 0x00-0x12).
+    """
+
+    def __init__(self,clock=time.time,temp=25.0,conversion=0.0):
+        """
+        clock is the function returning the current time in seconds,
+        temp the temperature of the chip, conversion the duration of a
+        temperature conversion in seconds (the DS3231 needs up to 0.2s).
+        """
+        self.regs = [0]*ds3231.ds3231._REGISTER_COUNT
+        self.regs[ds3231.ds3231._CONTROL_REGISTER] = 0x1C
+        self.regs[ds3231.ds3231._STATUS_REGISTER]  = 0x88
+        self._clock   = clock
+        self._time    = datetime(2000,1,1)     # time at clock-value _ref
+        self._dow     = 1                      # day-of-week at _time
+        self._ref     = clock()
+        self._checked = self._time             # alarms matched up to here
+        self._pointer = 0
+        self.temp = temp
+        self.conversion = conversion
+        self._conv_until = None                # end of a forced conversion
+        self._update_time_registers(self._time)
+
+    # --- time keeping   ---------------------------------------------------
+
+    def now(self):
+        """
+        Return the current time of the chip
+        """
+        return self._time + timedelta(seconds=int(self._clock()-self._ref))
+
+    def clock_at(self,dtime):
+        """
+        Return the clock-time at which the chip reaches the given time
+        """
+        delta = dtime - self._time
+        return self._ref + delta.days*86400 + delta.seconds
+
+    def _day_of_week(self,dtime):
+        days = (dtime.date() - self._time.date()).days
+        return (self._dow - 1 + days) % 7 + 1
+
+    def _update_time_registers(self,dtime):
+        self.regs[0:7] = [bcd.int_to_bcd(dtime.second),
+                          bcd.int_to_bcd(dtime.minute),
+                          bcd.int_to_bcd(dtime.hour),
+                          self._day_of_week(dtime),
+                          bcd.int_to_bcd(dtime.day),
+                          bcd.int_to_bcd(dtime.month) |
+                          (self.regs[ds3231.ds3231._MONTH_REGISTER] & 0x80),
+                          bcd.int_to_bcd(dtime.year % 100)]
+
+    def _rebase(self):
+        """ restart the time keeping from the time-registers """
+        (year,month,date,day,hours,minutes,seconds) = ds3231._decode_time(
+            self.regs)
+        try:
+            self._time = datetime(2000+year,month,date,hours,minutes,seconds)
+        except ValueError:
+            self._time = datetime(2000,1,1)
+        self._dow     = day or 1
+        self._ref     = self._clock()
+        self._checked = self._time
+
+    def next_alarm_match(self,alarm,after):
+        """
+        Return the first datetime after the given time matching the alarm
+        registers (None if the registers never match). The search skips
+        days, hours, minutes and seconds that cannot match, so it needs at
+        most a few hundred steps.
+        """
+        (offset,count) = ds3231.ds3231._ALARM_REGISTERS[alarm]
+        regs = self.regs[offset:offset+count]
+        if alarm == 2:
+            regs = [0x00] + regs                  # alarm2 matches at second 0
+        masks = [bool(r & 0x80) for r in regs]
+        (sec,min,hour) = [bcd.bcd_to_int(r & 0x7F) for r in regs[0:3]]
+        day = bcd.bcd_to_int(regs[3] & 0x3F)
+        dydt = bool(regs[3] & 0x40)
+        if alarm == 1 and all(masks):
+            return after + timedelta(seconds=1)
+
+        t = after.replace(microsecond=0) + timedelta(seconds=1)
+        limit = t + timedelta(days=400)           # invalid register values
+        while t < limit:
+            if not masks[3] and (
+                (dydt and self._day_of_week(t) != day) or
+                (not dydt and t.day != day)):
+                t = datetime(t.year,t.month,t.day) + timedelta(days=1)
+            elif not masks[2] and t.hour != hour:
+                t = t.replace(minute=0,second=0) + timedelta(hours=1)
+            elif not masks[1] and t.minute != min:
+                t = t.replace(second=0) + timedelta(minutes=1)
+            elif not masks[0] and t.second != sec:
+                t = t + timedelta(seconds=1)
+            else:
+                return t
+        return None
+
+    def update(self):
+        """
+        Update the time registers and set the alarm-flags of all alarms
+        that matched since the last update.
+        """
+        now = self.now()
+        if now > self._checked:
+            for alarm in (1,2):
+                match = self.next_alarm_match(alarm,self._checked)
+                if match is not None and match <= now:
+                    self.regs[ds3231.ds3231._STATUS_REGISTER] |= alarm
+            self._checked = now
+        self._update_time_registers(now)
+        if self._conv_until is not None and self._clock() >= self._conv_until:
+            self.regs[ds3231.ds3231._CONTROL_REGISTER] &= 0xDF    # CONV
+            self.regs[ds3231.ds3231._STATUS_REGISTER]  &= 0xFB    # BSY
+            self._conv_until = None
+
+    def interrupt(self):
+        """
+        Return the state of the INT/SQW-line (True: asserted, i.e. low).
+        """
+        control = self.regs[ds3231.ds3231._CONTROL_REGISTER]
+        status  = self.regs[ds3231.ds3231._STATUS_REGISTER]
+        return bool(control & 0x04 and control & status & 0x03)
+
+    # --- i2c-interface   --------------------------------------------------
+
+    def _next(self):
+        """ return the current register and increment the pointer """
+        reg = self._pointer
+        self._pointer = (self._pointer + 1) % len(self.regs)
+        return reg
+
+    def write(self,data):
+        """ write transfer: register followed by the values """
+        self.update()
+        self._pointer = data[0] % len(self.regs)
+        time_written = False
+        for value in data[1:]:
+            reg = self._next()
+            value &= 0xFF
+            if reg == ds3231.ds3231._STATUS_REGISTER:
+                # flags can only be cleared, BSY is read-only
+                old = self.regs[reg]
+                value = (old & value & 0x83) | (value & 0x08) | (old & 0x04)
+            elif reg == ds3231.ds3231._CONTROL_REGISTER:
+                if self._conv_until is not None:
+                    value |= 0x20                # conversion is running
+                elif value & 0x20:
+                    self._conv_until = self._clock() + self.conversion
+                    self.regs[ds3231.ds3231._STATUS_REGISTER] |= 0x04
+            elif reg > ds3231.ds3231._AGING_REGISTER:
+                continue                         # temperature is read-only
+            self.regs[reg] = value
+            time_written = time_written or reg <= ds3231.ds3231._YEAR_REGISTER
+        if time_written:
+            self._rebase()
+
+    def read(self,length):
+        """ read transfer at the current register """
+        self.update()
+        temp = int(round(self.temp*4)) & 0x3FF
+        self.regs[ds3231.ds3231._TEMP_MSB_REGISTER] = temp >> 2
+        self.regs[ds3231.ds3231._TEMP_LSB_REGISTER] = (temp & 0x03) << 6
+        return [self.regs[self._next()] for _ in range(length)]
+
+    def probe(self):
+        pass
+
+    # --- persistence   ----------------------------------------------------
+
+    def get_state(self):
+        self.update()
+        elapsed = int(self._clock() - self._ref)  # keep the phase of the second
+        return {'regs': self.regs,
+                'time': (self._time - _EPOCH).total_seconds() + elapsed,
+                'clock': self._ref + elapsed}
+
+    def set_state(self,state):
+        self.regs = state['regs']
+        self.regs[ds3231.ds3231._CONTROL_REGISTER] &= 0xDF   # conversion done
+        self.regs[ds3231.ds3231._STATUS_REGISTER]  &= 0xFB
+        self._rebase()
+        self._time = _EPOCH + timedelta(seconds=state['time'])
+        self._ref  = state['clock']
+        self._checked = self._time
+
+class at24c32_device(object):
+    """
+    Simulated AT24C32: 4096 bytes, 32 byte pages and a write-cycle during
+    which the chip does not acknowledge.
+    """
+
+    def __init__(self,clock=time.time,write_cycle=0.005):
+        """
+        clock is the function returning the current time in seconds,
+        write_cycle is the duration of the internal write-cycle in seconds.
+        """
+        self.mem = bytearray(b'\xFF'*ds3231.AT24C32_SIZE)
+        self.write_cycle = write_cycle
+        self._clock = clock
+        self._busy_until = 0
+        self._pointer = 0
+
+    def probe(self):
+        """ address-only transfer (ACK polling) """
+        if self._clock() < self._busy_until:
+            raise _nak()
+
+    def write(self,data):
+        """
+        Write transfer: two address bytes followed by the data. Without
+        data, this just sets the address-pointer.
+        """
+        self.probe()
+        if len(data) < 2 or len(data) > 2 + ds3231.AT24C32_PAGE_SIZE:
+            raise _nak()
+        self._pointer = ((data[0] << 8) | data[1]) % len(self.mem)
+        page   = self._pointer - (self._pointer % ds3231.AT24C32_PAGE_SIZE)
+        offset = self._pointer - page
+        for value in data[2:]:
+            # the address rolls over within the page
+            self.mem[page + offset] = value & 0xFF
+            offset = (offset + 1) % ds3231.AT24C32_PAGE_SIZE
+        if len(data) > 2:
+            self._pointer = page + offset
+            self._busy_until = self._clock() + self.write_cycle
+
+    def read(self,length):
+        """ sequential read starting at the current address """
+        self.probe()
+        out = []
+        for _ in range(length):
+            out.append(self.mem[self._pointer])
+            self._pointer = (self._pointer + 1) % len(self.mem)
+        return out
+
+    def get_state(self):
+        return {'mem': binascii.hexlify(bytes(self.mem)).decode('ascii')}
+
+    def set_state(self,state):
+        self.mem = bytearray(binascii.unhexlify(state['mem']))
+
+class sim_transport(transport):
+    """
+    Transport for a simulated bus with a DS3231 and an AT24C32.
+    """
+
+    def __init__(self,clock=time.time,state_file=None):
+        """
+        clock is the function returning the current time in seconds.
+        If state_file is given, the state of the devices is loaded from
+        and saved to this file.
+        """
+        super(sim_transport,self).__init__()
+        self.rtc    = ds3231_device(clock)
+        self.eeprom = at24c32_device(clock)
+        self.devices = {ds3231.DS3231ADDR:  self.rtc,
+                        ds3231.AT24C32ADDR: self.eeprom}
+        self._state_file = state_file
+        if state_file:
+            try:
+                with open(state_file,"r") as f:
+                    state = json.load(f)
+                self.rtc.set_state(state['ds3231'])
+                self.eeprom.set_state(state['at24c32'])
+            except IOError:
+                pass
+
+    def _device(self,addr):
+        try:
+            return self.devices[addr]
+        except KeyError:
+            raise _nak()
+
+    def write(self,addr,data):
+        self._count(1+len(data))
+        self._device(addr).write(list(data))
+        self._save()
+
+    def read(self,addr,length):
+        self._count(1+length)
+        return self._device(addr).read(length)
+
+    def write_read(self,addr,data,length):
+        self._count(2+len(data)+length)
+        device = self._device(addr)
+        device.write(list(data))
+        return device.read(length)
+
+    def probe(self,addr):
+        self._count(1)
+        self._device(addr).probe()
+
+    def _save(self):
+        if self._state_file:
+            with open(self._state_file,"w") as f:
+                json.dump({'ds3231':  self.rtc.get_state(),
+                           'at24c32': self.eeprom.get_state()},f)
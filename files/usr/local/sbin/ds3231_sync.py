@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Sub-second synchronization of the system time and the DS3231.
+#
+# The registers of the DS3231 have a resolution of one second, but the
+# second of the chip starts with the tick of the seconds-register (and is
+# restarted by a write of the seconds-register):
+#
+#   rtc_to_system: poll the seconds-register for the tick and set the
+#                  system time with clock_settime(2) (no subprocess), with
+#                  verify the error is measured at the next tick (this
+#                  takes another second)
+#   system_to_rtc: write all time registers with one block write at the
+#                  second boundary of the system time, compensating the
+#                  latency of the bus
+#
+# Both return a sync_result: the step of the system time (seconds, None
+# for system_to_rtc), the estimated error (None if it is not measured)
+# and its bound (seconds).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, time, ctypes, ctypes.util
+from collections import namedtuple
+
+CLOCK_REALTIME = 0
+
+sync_result = namedtuple('sync_result',['step','error','bound'])
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec',ctypes.c_long),('tv_nsec',ctypes.c_long)]
+
+_libc = None
+
+def set_system_time(stamp):
+    """
+    Set the system time (CLOCK_REALTIME) to the given timestamp (needs
+    CAP_SYS_TIME). Raises OSError on failure.
+    """
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6",
+                            use_errno=True)
+    seconds = int(stamp)
+    value = _timespec(seconds,int((stamp - seconds)*1e9))
+    if _libc.clock_settime(CLOCK_REALTIME,ctypes.byref(value)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno,"clock_settime: %s" % os.strerror(errno))
+
+def rtc_to_system(rtc,verify=False):
+    """
+    Set the system time from the RTC at the tick of the seconds-register.
+    Without verify, only the bound of the error is known. With verify,
+    the error is the system time at the next tick minus the RTC time
+    (the bound is then the resolution of this measurement).
+    """
+    (dtime,stamp,bound) = rtc.read_tick()
+    rtc_time = time.mktime(dtime.timetuple())
+    set_system_time(rtc_time + time.time() - stamp)
+    if not verify:
+        return sync_result(rtc_time - stamp,None,bound)
+    (dtime,check,check_bound) = rtc.read_tick()
+    return sync_result(rtc_time - stamp,
+                       check - time.mktime(dtime.timetuple()),check_bound)
+
+def system_to_rtc(rtc):
+    """
+    Set the RTC from the system time at the next second boundary
+    """
+    (_,error,bound) = rtc.write_datetime_sync()
+    return sync_result(None,error,bound)
+
+def format_result(result):
+    """ return a short description of the result """
+    if result.error is None:
+        text = "error: +/-%.1fms" % (1000*result.bound)
+    else:
+        text = "error: %+.1fms (+/-%.1fms)" % (1000*result.error,
+                                               1000*result.bound)
+    if result.step is None:
+        return text
+    return "step: %+.3fs, %s" % (result.step,text)
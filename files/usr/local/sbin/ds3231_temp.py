@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Temperature sampling with the sensor of the DS3231.
+#
+# The DS3231 updates its temperature registers only every 64 seconds, so
+# the sampler forces a conversion for every sample (at most about five
+# samples per second, a conversion takes up to 0.2s). Samples are stored
+# in a ring buffer of two arrays (timestamps and temperatures) which are
+# allocated once; the generator run() yields the index of every new
+# sample into these arrays.
+#
+# Only the storage of the samples is preallocated: every poll of a
+# conversion still returns a new list of registers from the transport
+# (python-smbus allocates the result of every read).
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import time, array
+
+SIZE = 3600                 # samples kept in the ring buffer
+RATE = 1.0                  # samples per second
+
+class sampler(object):
+    """
+    Sample the temperature at a fixed rate into a ring buffer.
+    """
+
+    def __init__(self,rtc,rate=RATE,size=SIZE,convert=True):
+        """
+        rtc is a ds3231 (or a client of the rtc daemon), rate the number of
+        samples per second. With convert=False, the sampler just reads the
+        registers (the value changes every 64 seconds).
+        """
+        if rate <= 0 or size <= 0:
+            raise ValueError("rate and size must be positive")
+        self.rtc      = rtc
+        self.interval = 1.0/rate
+        self.size     = size
+        self.convert  = convert
+        self.times    = array.array('d',[0.0])*size
+        self.temps    = array.array('d',[0.0])*size
+        self.count    = 0                   # samples taken in total
+
+    def sample(self):
+        """ take one sample, returns its index in the ring buffer """
+        if self.convert:
+            temp = self.rtc.trigger_conversion()
+        else:
+            temp = self.rtc.get_temp()
+        index = self.count % self.size
+        self.times[index] = time.time()
+        self.temps[index] = temp
+        self.count += 1
+        return index
+
+    def run(self,count=None):
+        """
+        Generator: take count samples (None: forever) at the rate of the
+        sampler and yield the index of every sample. If a sample takes
+        longer than the interval, the following samples are delayed (no
+        catch-up).
+        """
+        due = time.time()
+        while count is None or count > 0:
+            yield self.sample()
+            if count is not None:
+                count -= 1
+            due += self.interval
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                due -= delay
+
+    def indices(self):
+        """ generate the indices of all samples in the buffer, oldest first """
+        first = max(0,self.count - self.size)
+        for n in range(first,self.count):
+            yield n % self.size
+
+    def stats(self):
+        """
+        Return a tuple (count,min,max,mean) of the samples in the buffer,
+        or None if there are no samples
+        """
+        if not self.count:
+            return None
+        (low,high,total) = (float("inf"),float("-inf"),0.0)
+        for index in self.indices():
+            value = self.temps[index]
+            low   = min(low,value)
+            high  = max(high,value)
+            total += value
+        count = min(self.count,self.size)
+        return (count,low,high,total/count)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Transports for the DS3231 driver: the driver uses one of these classes
+# for all i2c-transfers.
+#
+#   smbus   - python-smbus (default)
+#   i2cdev  - raw /dev/i2c-N with combined write-read transfers (I2C_RDWR)
+#   sim     - simulated DS3231 and AT24C32 (see ds3231_sim.py)
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os
+
+# upper bounds (seconds) of the latency histograms of bus_stats
+LATENCY_BUCKETS = (0.0002,0.0005,0.001,0.002,0.005,0.01,0.02,0.05,0.1)
+
+class bus_stats(object):
+    """
+    Statistics of the bus operations of a driver: per operation (e.g.
+    "read" or "eeprom_write") the number of calls, bus transactions, the
+    total latency and a latency histogram (LATENCY_BUCKETS, the last
+    count is for larger latencies).
+    """
+
+    def __init__(self):
+        self.ops = {}
+
+    def record(self,op,seconds,transactions):
+        stat = self.ops.get(op)
+        if stat is None:
+            stat = self.ops[op] = {'calls': 0, 'transactions': 0,
+                                   'seconds': 0.0,
+                                   'buckets': [0]*(len(LATENCY_BUCKETS)+1)}
+        stat['calls']        += 1
+        stat['transactions'] += transactions
+        stat['seconds']      += seconds
+        for (i,bound) in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stat['buckets'][i] += 1
+                break
+        else:
+            stat['buckets'][-1] += 1
+
+class transport(object):
+    """
+    Base class of all transports. Transports count the number of bus
+    transactions and the number of bytes on the bus (including the
+    address bytes).
+    """
+
+    max_block = None          # max. bytes of a single write (None: no limit)
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes        = 0
+
+    def _count(self,nbytes,transactions=1):
+        self.transactions += transactions
+        self.bytes        += nbytes
+
+    def write(self,addr,data):
+        """
+        Write the bytes in data (a list of integers) to the device.
+        """
+        raise NotImplementedError()
+
+    def read(self,addr,length):
+        """
+        Read length bytes from the device (at its current address).
+        Returns a list of integers.
+        """
+        raise NotImplementedError()
+
+    def write_read(self,addr,data,length):
+        """
+        Write data, then read length bytes (with a repeated start if
+        supported). Returns a list of integers.
+        """
+        raise NotImplementedError()
+
+    def probe(self,addr):
+        """
+        Address the device without data. Raises IOError if the device
+        does not acknowledge.
+        """
+        raise NotImplementedError()
+
+    def read_registers(self,addr,register,length):
+        """
+        Read length consecutive registers starting at register.
+        """
+        return self.write_read(addr,[register],length)
+
+    def write_registers(self,addr,register,values):
+        """
+        Write values to consecutive registers starting at register.
+        """
+        self.write(addr,[register]+list(values))
+
+    def close(self):
+        """
+        Release the bus.
+        """
+        pass
+
+class smbus_transport(transport):
+    """
+    Transport using python-smbus. Block transfers are limited to 32 bytes,
+    reads without register (e.g. from the AT24C32) need one transaction
+    per byte.
+    """
+
+    max_block = 33            # command byte + 32 data bytes
+
+    def __init__(self,port):
+        super(smbus_transport,self).__init__()
+        import smbus
+        self._bus = smbus.SMBus(port)
+
+    def write(self,addr,data):
+        self._count(1+len(data))
+        if len(data) == 1:
+            self._bus.write_byte(addr,data[0])
+        else:
+            self._bus.write_i2c_block_data(addr,data[0],list(data[1:]))
+
+    def read(self,addr,length):
+        self._count(2*length,length)
+        return [self._bus.read_byte(addr) for _ in range(length)]
+
+    def write_read(self,addr,data,length):
+        if len(data) == 1 and length <= 32:
+            return self.read_registers(addr,data[0],length)
+        self.write(addr,data)
+        return self.read(addr,length)
+
+    def probe(self,addr):
+        self._count(1)
+        self._bus.write_quick(addr)
+
+    def read_registers(self,addr,register,length):
+        self._count(3+length)
+        if length == 1:
+            return [self._bus.read_byte_data(addr,register)]
+        else:
+            return self._bus.read_i2c_block_data(addr,register,length)
+
+    def write_registers(self,addr,register,values):
+        self._count(2+len(values))
+        if len(values) == 1:
+            self._bus.write_byte_data(addr,register,values[0])
+        else:
+            self._bus.write_i2c_block_data(addr,register,list(values))
+
+    def close(self):
+        self._bus.close()
+
+class i2cdev_transport(transport):
+    """
+    Transport using the raw i2c-dev interface. write_read() is a single
+    ioctl with combined messages (write, repeated start, read), so a
+    register read or a sequential EEPROM read is one transaction.
+    """
+
+    _I2C_RDWR = 0x0707
+    _I2C_M_RD = 0x0001
+
+    def __init__(self,port):
+        super(i2cdev_transport,self).__init__()
+        import ctypes, fcntl
+
+        class i2c_msg(ctypes.Structure):
+            _fields_ = [('addr',  ctypes.c_uint16),
+                        ('flags', ctypes.c_uint16),
+                        ('len',   ctypes.c_uint16),
+                        ('buf',   ctypes.POINTER(ctypes.c_uint8))]
+
+        class i2c_rdwr_ioctl_data(ctypes.Structure):
+            _fields_ = [('msgs',  ctypes.POINTER(i2c_msg)),
+                        ('nmsgs', ctypes.c_uint32)]
+
+        self._ctypes   = ctypes
+        self._ioctl    = fcntl.ioctl
+        self._i2c_msg  = i2c_msg
+        self._rdwr_data = i2c_rdwr_ioctl_data
+        self._fd = os.open("/dev/i2c-%d" % port,os.O_RDWR)
+
+    def _transfer(self,addr,*msgs):
+        """
+        Execute the messages (tuples (flags,buffer)) with one ioctl.
+        """
+        ctypes = self._ctypes
+        arr = (self._i2c_msg * len(msgs))()
+        for i,(flags,buf) in enumerate(msgs):
+            arr[i].addr  = addr
+            arr[i].flags = flags
+            arr[i].len   = len(buf)
+            arr[i].buf   = ctypes.cast(buf,ctypes.POINTER(ctypes.c_uint8))
+        data = self._rdwr_data(arr,len(msgs))
+        self._count(sum(1+len(buf) for _,buf in msgs))
+        self._ioctl(self._fd,self._I2C_RDWR,data)
+
+    def write(self,addr,data):
+        buf = (self._ctypes.c_uint8 * len(data))(*data)
+        self._transfer(addr,(0,buf))
+
+    def read(self,addr,length):
+        rbuf = (self._ctypes.c_uint8 * length)()
+        self._transfer(addr,(self._I2C_M_RD,rbuf))
+        return list(rbuf)
+
+    def write_read(self,addr,data,length):
+        wbuf = (self._ctypes.c_uint8 * len(data))(*data)
+        rbuf = (self._ctypes.c_uint8 * length)()
+        self._transfer(addr,(0,wbuf),(self._I2C_M_RD,rbuf))
+        return list(rbuf)
+
+    def probe(self,addr):
+        self._transfer(addr,(0,(self._ctypes.c_uint8 * 0)()))
+
+    def close(self):
+        os.close(self._fd)
+
+def get_transport(spec,port):
+    """
+    Create a transport from a specification string:
+    smbus, i2cdev or sim[:state-file].
+    """
+    if not isinstance(spec,str):
+        return spec                           # already a transport
+    (name,_,arg) = spec.partition(':')
+    if name == 'smbus':
+        return smbus_transport(port)
+    elif name == 'i2cdev':
+        return i2cdev_transport(port)
+    elif name == 'sim':
+        import ds3231_sim
+        return ds3231_sim.sim_transport(state_file=arg or None)
+    else:
+        raise ValueError("unsupported transport: %s" % spec)
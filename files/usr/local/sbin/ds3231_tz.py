@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Conversions between local time and UTC for the DS3231 driver.
+#
+# The index holds the instants (seconds since the epoch, UTC) at which the
+# local timezone switches between standard and daylight saving time. It is
+# built once per year from the C library (i.e. from the same tzdata the
+# rest of the system uses) and every lookup is a bisect.
+#
+# The conversions give the same results as arrow with the 'local' zone
+# (dateutil's tzlocal): the offsets are the current standard and DST
+# offsets of the zone, only the switching instants are taken from tzdata.
+#
+# Local times during a DST change:
+#   gap  (e.g. 02:30 when clocks jump from 02:00 to 03:00): the DST offset
+#        is used, so the time maps to the hour before the gap
+#   fold (e.g. 02:30 when clocks go back from 03:00 to 02:00): the first
+#        occurrence (DST) is used
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import time, bisect, calendar
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970,1,1)
+_DAY   = 86400
+
+def _seconds(dtime):
+    """ seconds since the epoch of a naive datetime (ignoring microseconds) """
+    delta = dtime - _EPOCH
+    return delta.days*_DAY + delta.seconds
+
+class tz_index(object):
+    """
+    Sorted index of the DST-transitions of the local timezone.
+    """
+
+    def __init__(self):
+        self.std = -time.timezone                 # offsets in seconds
+        self.dst = -time.altzone if time.daylight else self.std
+        self._years = {}                          # year -> (isdst,transitions)
+
+    def _build_year(self,year):
+        """
+        Find all transitions of a year: sample the DST-flag once per day,
+        then bisect down to the second where it changes.
+        """
+        start = calendar.timegm((year,1,1,0,0,0))
+        end   = calendar.timegm((year+1,1,1,0,0,0))
+        isdst = time.localtime(start).tm_isdst > 0
+        transitions = []
+        (low,flag) = (start,isdst)
+        while low < end:
+            high = min(low+_DAY,end)
+            if (time.localtime(high).tm_isdst > 0) != flag:
+                while high - low > 1:             # flag changes in (low,high]
+                    mid = (low + high) // 2
+                    if (time.localtime(mid).tm_isdst > 0) == flag:
+                        low = mid
+                    else:
+                        high = mid
+                if high < end:
+                    transitions.append(high)
+                flag = not flag
+            low = high
+        self._years[year] = (isdst,transitions)
+        return self._years[year]
+
+    def isdst(self,seconds):
+        """
+        Return True if DST is in effect at the given instant (UTC)
+        """
+        if self.std == self.dst:
+            return False
+        year = time.gmtime(seconds).tm_year
+        try:
+            (isdst,transitions) = self._years[year]
+        except KeyError:
+            (isdst,transitions) = self._build_year(year)
+        return isdst != bool(bisect.bisect_right(transitions,seconds) & 1)
+
+    def local_offset(self,dtime):
+        """
+        Return the offset (seconds) of a naive local datetime to UTC
+        """
+        naive = _seconds(dtime) - self.std
+        if self.isdst(naive):
+            return self.dst                       # DST or gap
+        elif self.isdst(naive - (self.dst - self.std)):
+            return self.dst                       # fold: first occurrence
+        return self.std
+
+    def utc_offset(self,dtime):
+        """
+        Return the offset (seconds) of local time at a naive UTC datetime
+        """
+        return self.dst if self.isdst(_seconds(dtime)) else self.std
+
+    def is_gap(self,dtime):
+        """
+        Check if a naive local datetime does not exist (clocks jump forward)
+        """
+        return self.utc2local(self.local2utc(dtime)) != dtime
+
+    def is_fold(self,dtime):
+        """
+        Check if a naive local datetime occurs twice (clocks go back)
+        """
+        naive = _seconds(dtime) - self.std
+        return (self.std != self.dst and not self.isdst(naive) and
+                self.isdst(naive - (self.dst - self.std)))
+
+    def local2utc(self,dtime):
+        """
+        Convert a naive datetime-object in local-time to UTC
+        """
+        return dtime - timedelta(seconds=self.local_offset(dtime))
+
+    def utc2local(self,dtime):
+        """
+        Convert a naive datetime-object in UTC to local-time
+        """
+        return dtime + timedelta(seconds=self.utc_offset(dtime))
+
+    def local2utc_many(self,dtimes):
+        """
+        Convert an iterable of naive local datetimes to UTC. Returns a list.
+        """
+        convert = self.local2utc
+        return [convert(dtime) for dtime in dtimes]
+
+    def utc2local_many(self,dtimes):
+        """
+        Convert an iterable of naive UTC datetimes to local-time.
+        Returns a list.
+        """
+        convert = self.utc2local
+        return [convert(dtime) for dtime in dtimes]
+
+_index = None
+
+def get_index():
+    """
+    Return the (shared) index of the local timezone
+    """
+    global _index
+    if _index is None:
+        _index = tz_index()
+    return _index
@@ -11,11 +11,28 @@
 #
 # --------------------------------------------------------------------------
 
-import os, subprocess, sys, syslog, signal
-import datetime, re
+# keep the imports minimal: the start-command runs early during boot.
+# subprocess, shlex, threading and re are imported on first use
+import os, sys, time, syslog, signal
+import datetime
 import ConfigParser
 
-import ds3231
+import ds3231, wake_journal, wake_metrics, wake_status, ds3231_lock
+
+# paths shared with other programs are owned by the modules using them
+STATUS_FILE  = wake_metrics.STATUS_FILE
+TIMINGS_FILE = wake_metrics.TIMINGS_FILE
+STATE_FILE   = wake_status.STATE_FILE
+LOCK_FILE    = ds3231_lock.LOCK_FILE
+
+CONFIG_FILE = "/etc/wake-on-rtc.conf"
+NEXT_BOOT_CACHE = "/var/lib/wake-on-rtc.nextboot"
+DEADLINE    = 30                        # default deadline (seconds) per phase
+KILL_GRACE  = 1                         # seconds to reap a killed hook
+
+debug  = '0'
+fp_log = None                           # opened on first use (debug only)
+bus_lock = None                         # created on first use
 
 # --- helper functions   ---------------------------------------------------
 
@@ -25,12 +42,60 @@ def write_log(msg):
   global debug, fp_log
   if debug == '1':
     syslog.syslog(msg)
+    if not fp_log:
+      fp_log = open("/var/log/wake-on-rtc.log","at")
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     fp_log.write("[" + now + "] " + msg+"\n")
     fp_log.flush()
 
 # --------------------------------------------------------------------------
 
+def lock_bus(rtc):
+  """
+  Lock the bus against the rtc daemon (see ds3231_lock.py). After a
+  timeout, the service continues without the lock. The lock is released
+  by the kernel if the service dies.
+  """
+  global bus_lock
+  if bus_lock is None:
+    bus_lock = ds3231_lock.bus_lock(LOCK_FILE)
+  if not bus_lock.acquire():
+    syslog.syslog("Timeout while waiting for the bus lock %s" % LOCK_FILE)
+  elif bus_lock.changed:
+    rtc.invalidate()                    # the daemon accessed the rtc
+
+def unlock_bus():
+  if bus_lock:
+    bus_lock.release()
+
+def write_journal(rtc,event,**fields):
+  """ append a record to the journal in the AT24C32 (if configured) """
+  global config
+  if not config['journal']:
+    return
+  lock_bus(rtc)
+  try:
+    journal = wake_journal.journal(rtc)
+    rec = journal.append(event,temp=rtc.get_temp(),**fields)
+    write_log("journal record %d written" % rec.seq)
+  except:
+    syslog.syslog("Error while writing journal: %s" % sys.exc_info()[0])
+  finally:
+    unlock_bus()
+
+def write_status(**fields):
+  """ publish the state of the service (see wake_status.py) """
+  try:
+    wake_status.update(STATE_FILE,**fields)
+  except:
+    syslog.syslog("Error while writing status: %s" % sys.exc_info()[1])
+
+def get_timestamp(dtime):
+  """ seconds since the epoch of a naive local datetime (None: None) """
+  return time.mktime(dtime.timetuple()) if dtime else None
+
+# --------------------------------------------------------------------------
+
 def get_config(cparser):
   """ parse configuration """
   global debug
@@ -40,6 +105,8 @@ def get_config(cparser):
   alarm = cparser.getint('GLOBAL','alarm')
   i2c   = cparser.getint('GLOBAL','i2c')
   utc   = cparser.getint('GLOBAL','utc')
+  journal = cparser.getint('GLOBAL','journal')
+  transport = cparser.get('GLOBAL','transport')
   
   if cparser.has_option('boot','hook_cmd'):
     boot_hook = cparser.get('boot','hook_cmd')
@@ -49,18 +116,88 @@ def get_config(cparser):
     auto_halt = cparser.getint('boot','auto_halt')
   else:
     auto_halt = 0
+  if cparser.has_option('boot','latency'):
+    latency = cparser.getint('boot','latency')
+  else:
+    latency = 0
+  if cparser.has_option('boot','ready_cmd'):
+    ready_cmd = cparser.get('boot','ready_cmd')
+  else:
+    ready_cmd = None
+  if cparser.has_option('boot','latency_history'):
+    latency_history = cparser.get('boot','latency_history')
+  else:
+    latency_history = None
+  if cparser.has_option('boot','deadline'):
+    boot_deadline = cparser.getfloat('boot','deadline')
+  else:
+    boot_deadline = DEADLINE
 
-  next_boot   = cparser.get('halt','next_boot')
+  if cparser.has_option('halt','next_boot'):
+    next_boot = cparser.get('halt','next_boot')
+  else:
+    next_boot = None
+  if cparser.has_option('halt','next_boot_cache'):
+    next_boot_cache = cparser.get('halt','next_boot_cache')
+  else:
+    next_boot_cache = None
+  if cparser.has_option('halt','deadline'):
+    halt_deadline = cparser.getfloat('halt','deadline')
+  else:
+    halt_deadline = DEADLINE
+  if cparser.has_option('halt','schedule'):
+    schedule = cparser.get('halt','schedule')
+  else:
+    schedule = None
+  if cparser.has_option('halt','schedule_cache'):
+    schedule_cache = cparser.get('halt','schedule_cache')
+  else:
+    schedule_cache = None
+  if cparser.has_option('halt','plan_file'):
+    plan_file = cparser.get('halt','plan_file')
+  else:
+    plan_file = None
+  if cparser.has_option('drift','history'):
+    drift_history = cparser.get('drift','history')
+  else:
+    drift_history = None
+  if cparser.has_option('halt','recurring'):
+    recurring = ds3231.parse_recurring(cparser.get('halt','recurring').split())
+  else:
+    recurring = None
   lead_time   = cparser.getint('halt','lead_time')
+  if cparser.has_option('halt','lead_percentile'):
+    lead_percentile = cparser.getint('halt','lead_percentile')
+  else:
+    lead_percentile = 0
+  if cparser.has_option('halt','lead_limit'):
+    lead_limit = cparser.get('halt','lead_limit')
+  else:
+    lead_limit = 'floor'
   set_hwclock = cparser.getint('halt','set_hwclock')
 
   return {'alarm':       alarm,
           'i2c':         i2c,
           'utc':         utc,
+          'journal':     journal,
+          'transport':   transport,
           'boot_hook':   boot_hook,
           'auto_halt':   auto_halt,
+          'latency':     latency,
+          'ready_cmd':   ready_cmd,
+          'latency_history': latency_history,
+          'boot_deadline': boot_deadline,
           'next_boot':   next_boot,
+          'next_boot_cache': next_boot_cache,
+          'halt_deadline': halt_deadline,
+          'schedule':    schedule,
+          'schedule_cache': schedule_cache,
+          'recurring':   recurring,
+          'plan_file':   plan_file,
+          'drift_history': drift_history,
           'lead_time':   lead_time,
+          'lead_percentile': lead_percentile,
+          'lead_limit':  lead_limit,
           'set_hwclock': set_hwclock}
 
 # --- convert time-string to datetime-object   -----------------------------
@@ -78,6 +215,7 @@ def get_datetime(dtstring):
     dtstring = dtstring + " 00:00:00"
 
   # parse string and check if we have six items
+  import re
   dateParts= re.split('\.|/|:|-| ',dtstring)
   count = len(dateParts)
   if count < 5 or count > 6:
@@ -91,14 +229,181 @@ def get_datetime(dtstring):
 
   return datetime.datetime.strptime(dtstring,format)
 
+# --- deadlines and hooks   ------------------------------------------------
+
+class HookTimeout(Exception):
+  """ a hook (or query) did not finish before the deadline """
+  pass
+
+class phase(object):
+  """ total deadline of a phase (start or stop) and timings of its steps """
+
+  def __init__(self,name,deadline):
+    self.name     = name
+    self.deadline = deadline            # seconds, <= 0: no deadline
+    self.start    = os.times()[4]       # monotonic (elapsed real time)
+    self.last     = self.start
+    self.steps    = []                  # (step,seconds)
+
+  def remaining(self):
+    """ seconds until the deadline (None: no deadline) """
+    if self.deadline <= 0:
+      return None
+    return max(0.0,self.start + self.deadline - os.times()[4])
+
+  def step(self,name):
+    """ log the duration of a step (since the previous step) """
+    now = os.times()[4]
+    write_log("%s: %s took %.2fs" % (self.name,name,now - self.last))
+    self.steps.append((name,now - self.last))
+    self.last = now
+
+  def done(self):
+    """ log the total duration and store the timings (for rtcctl metrics) """
+    elapsed = os.times()[4] - self.start
+    write_log("%s: total %.2fs" % (self.name,elapsed))
+    if 0 < self.deadline < elapsed:
+      syslog.syslog("%s exceeded the deadline of %gs" % (self.name,self.deadline))
+    try:
+      wake_metrics.save_timings(self.name,self.steps+[("total",elapsed)],
+                                TIMINGS_FILE)
+    except:
+      syslog.syslog("Error while saving timings: %s" % sys.exc_info()[1])
+
+class task(object):
+  """ run a function in a background thread """
+
+  def __init__(self,func,*args):
+    import threading
+    (self._result,self._error) = (None,None)
+    self._thread = threading.Thread(target=self._run,args=(func,args))
+    self._thread.daemon = True          # never delays the exit
+    self._thread.start()
+
+  def _run(self,func,args):
+    try:
+      self._result = func(*args)
+    except:
+      self._error = sys.exc_info()[1]
+
+  def result(self,timeout=None):
+    """ wait for the result (raises the exception of the function) """
+    self._thread.join(timeout)
+    if self._thread.is_alive():
+      raise HookTimeout("no result after %.1fs" % timeout)
+    if self._error:
+      raise self._error
+    return self._result
+
+def spawn_hook(cmd,*args):
+  """ start a hook-command without a shell in the background """
+  import subprocess, shlex
+  return subprocess.Popen(shlex.split(cmd) + list(args))
+
+def run_hook(cmd,timeout=None):
+  """
+  run a hook-command without a shell and return (stdout,stderr). The
+  command (and its children) is killed after timeout seconds
+  """
+  import subprocess, shlex, threading
+  proc = subprocess.Popen(shlex.split(cmd),preexec_fn=os.setsid,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  output = []
+  reader = threading.Thread(target=lambda: output.append(proc.communicate()))
+  reader.daemon = True
+  reader.start()
+  reader.join(timeout)
+  if reader.is_alive():
+    try:
+      os.killpg(proc.pid,signal.SIGKILL)
+    except OSError:
+      pass
+    reader.join(KILL_GRACE)
+    raise HookTimeout("%s: no result after %.1fs" % (cmd,timeout))
+  return output[0]
+
+# --- cached boot-time   ---------------------------------------------------
+
+def get_boottime_cache():
+  """ file of the last known boot-time """
+  global config
+  return config['next_boot_cache'] or NEXT_BOOT_CACHE
+
+def save_boottime(boot_dt):
+  """ cache the last known boot-time (None: remove), only if it changed """
+  path  = get_boottime_cache()
+  value = boot_dt.strftime("%Y-%m-%d %H:%M:%S") if boot_dt else ""
+  try:
+    with open(path,"r") as f:
+      if f.read().strip() == value:
+        return
+  except (IOError,OSError):
+    if not boot_dt:
+      return
+  try:
+    if boot_dt:
+      tmp = path + ".tmp"
+      with open(tmp,"w") as f:
+        f.write(value+"\n")
+      os.rename(tmp,path)
+    else:
+      os.unlink(path)
+  except (IOError,OSError):
+    syslog.syslog("Error while caching boot-time: %s" % sys.exc_info()[1])
+
+def get_cached_boottime(lead_delta):
+  """ the last known boot-time (minus lead_delta), if still in the future """
+  try:
+    with open(get_boottime_cache(),"r") as f:
+      boot_dt = get_datetime(f.read().strip()) - lead_delta
+  except:
+    return None
+  if boot_dt <= datetime.datetime.now():
+    write_log("cached boot_dt %s is in the past" % boot_dt)
+    return None
+  return boot_dt
+
+def wait_boottime(query,steps,lead_delta):
+  """
+  wait for the boot-time query until the deadline of the phase. If the
+  query fails or times out, fall back to the cached boot-time.
+  Returns a tuple (boot_dt,error)
+  """
+  timeout = steps.remaining()
+  if timeout is not None:
+    timeout += KILL_GRACE
+  try:
+    return (query.result(timeout),wake_journal.ERR_NONE)
+  except HookTimeout:
+    error = wake_journal.ERR_TIMEOUT
+    syslog.syslog("Timeout while querying boot-time: %s" % sys.exc_info()[1])
+  except:
+    error = wake_journal.ERR_NEXT_BOOT
+    syslog.syslog("Error while querying boot-time: %s" % sys.exc_info()[1])
+  boot_dt = get_cached_boottime(lead_delta)
+  if boot_dt:
+    syslog.syslog("using cached boot-time: %s" % (boot_dt + lead_delta))
+  return (boot_dt,error)
+
 # --- query next boot-time   -----------------------------------------------
 
-def get_boottime():
+def get_boottime_schedule():
+  """ query next boot-time from the schedule file """
+  global config
+  import wake_schedule
+  if config['schedule_cache']:
+    cache = config['schedule_cache']
+  else:
+    cache = wake_schedule.CACHE_FILE
+  boot_dt = wake_schedule.schedule(config['schedule'],cache).next_wake()
+  write_log("boot_dt from schedule: %s" % boot_dt)
+  return boot_dt
+
+def get_boottime_hook(timeout=None):
+  """ query next boot-time from the next_boot-hook """
   global config
   write_log("executing next_boot-hook %s" % config['next_boot'])
-  proc = subprocess.Popen(config['next_boot'],
-                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-  (boot_time,err) = proc.communicate(None)
+  (boot_time,err) = run_hook(config['next_boot'],timeout)
   write_log("raw boot time: %s" % boot_time)
   if len(err) > 0:
     write_log("error text of next_boot-hook: %s" % err)
@@ -107,14 +412,172 @@ def get_boottime():
     return None
   boot_dt = get_datetime(boot_time.strip())
   write_log("raw boot_dt: %s" % boot_dt)
+  return boot_dt
+
+def get_boottime(lead_delta=None,timeout=None):
+  """
+  query next boot-time: from the recurring alarm or the schedule if
+  configured, with the next_boot-hook (killed after timeout seconds) as
+  fallback. The boot-time of the schedule or the hook is cached.
+  """
+  global config
+  if lead_delta is None:
+    lead_delta = get_lead_time()
+  if config['recurring']:
+    (every,fields) = config['recurring']
+    boot_dt = ds3231.next_recurring(datetime.datetime.now()+lead_delta,
+                                    every,**fields)
+    write_log("boot_dt from recurring alarm: %s" % boot_dt)
+  elif config['schedule']:
+    try:
+      boot_dt = get_boottime_schedule()
+    except:
+      if not config['next_boot']:
+        raise
+      syslog.syslog("Error while reading schedule: %s, using next_boot-hook" %
+                    sys.exc_info()[1])
+      boot_dt = get_boottime_hook(timeout)
+    save_boottime(boot_dt)
+  elif config['next_boot']:
+    boot_dt = get_boottime_hook(timeout)
+    save_boottime(boot_dt)
+  else:
+    boot_dt = None
+  if boot_dt is None:
+    return None
 
   # substract lead_time
-  lead_delta = datetime.timedelta(minutes=config['lead_time'])
   boot_dt = boot_dt - lead_delta
   write_log("calculated boot_dt: %s" % boot_dt)
 
   return boot_dt
 
+# --- boot latency   -------------------------------------------------------
+
+def get_latency_file():
+  """ file of the boot latency history """
+  global config
+  import wake_latency
+  return config['latency_history'] or wake_latency.HISTORY_FILE
+
+def get_wake_latency(rtc):
+  """ seconds since the alarm fired (rtc-time, before the alarm is cleared) """
+  global config
+  rtc.snapshot()
+  delta = rtc.read_datetime() - rtc.get_alarm_time(config['alarm'])
+  rtc.invalidate()
+  return delta.days*86400 + delta.seconds
+
+def record_latency(name,seconds):
+  """ add a delay to the boot latency history """
+  import wake_latency
+  history = wake_latency.history(get_latency_file())
+  if history.add(name,seconds):
+    history.save()
+    write_log("%s-latency: %ds" % (name,seconds))
+  else:
+    write_log("implausible %s-latency: %ds" % (name,seconds))
+
+def run_ready_hook(latency):
+  """ run the ready-hook in the background and record the ready-latency """
+  global config
+  start = os.times()[4]                 # monotonic (elapsed real time)
+  if os.fork():
+    return
+  try:
+    write_log("executing ready-hook %s" % config['ready_cmd'])
+    spawn_hook(config['ready_cmd']).wait()
+    record_latency('ready',latency + os.times()[4] - start)
+  except:
+    syslog.syslog("Error while executing ready-hook: %s" % sys.exc_info()[0])
+  finally:
+    os._exit(0)
+
+def get_lead_time():
+  """
+  return the lead time (timedelta): the static lead_time, or the configured
+  percentile of the boot latencies (ready, or start if there are not
+  enough ready-latencies) rounded up to minutes, with the static value as
+  floor or ceiling
+  """
+  global config
+  lead = datetime.timedelta(minutes=config['lead_time'])
+  if config['lead_percentile'] <= 0:
+    return lead
+  try:
+    import wake_latency
+    history = wake_latency.history(get_latency_file())
+    value = history.percentile('ready',config['lead_percentile'])
+    if value is None:
+      value = history.percentile('start',config['lead_percentile'])
+  except:
+    value = None
+    syslog.syslog("Error while reading boot latencies: %s" % sys.exc_info()[0])
+  if value is None:
+    return lead
+  measured = datetime.timedelta(minutes=-(-value // 60))
+  if config['lead_limit'] == 'ceiling':
+    lead = min(lead,measured)
+  else:
+    lead = max(lead,measured)
+  write_log("lead time: %s (p%d of boot latencies: %s)" %
+            (lead,config['lead_percentile'],measured))
+  return lead
+
+# --------------------------------------------------------------------------
+
+def record_drift(rtc,flags=0):
+  """ record a drift sample (if enabled and the system time is synchronized) """
+  global config
+  if not config['drift_history']:
+    return
+  try:
+    import ds3231_drift
+    if not ds3231_drift.is_synchronized():
+      write_log("system time not synchronized, no drift sample")
+      return
+    lock_bus(rtc)
+    try:
+      sample = ds3231_drift.measure(rtc,flags)
+    finally:
+      unlock_bus()
+    ds3231_drift.history(config['drift_history']).append(sample)
+    write_log("drift sample: offset %.3fs" % sample.offset)
+    return sample
+  except:
+    syslog.syslog("Error while recording drift sample: %s" % sys.exc_info()[0])
+
+# --- wake plan   ----------------------------------------------------------
+
+def get_plan_file():
+  """ file of the wake plan """
+  global config
+  import wake_plan
+  return config['plan_file'] or wake_plan.PLAN_FILE
+
+def is_intermediate_wake():
+  """ check if this boot is an intermediate wake of the stored plan """
+  import wake_plan
+  return wake_plan.is_intermediate(get_plan_file(),datetime.datetime.now())
+
+def plan_wakes(boot_dt):
+  """
+  plan the wakes to reach boot_dt (boot_dt might be beyond the horizon of
+  the alarm) and store the plan. Returns the first wake.
+  """
+  global config
+  import wake_plan
+  if config['utc']:
+    convert = ds3231._local2utc
+  else:
+    convert = None
+  wakes = wake_plan.plan(config['alarm'],datetime.datetime.now(),boot_dt,
+                         convert=convert)
+  wake_plan.save(get_plan_file(),boot_dt,wakes)
+  if len(wakes) > 1:
+    write_log("wake plan: %s" % ", ".join(str(w) for w in wakes))
+  return wakes[0]
+
 # --- system startup   -----------------------------------------------------
 
 def process_start():
@@ -122,45 +585,123 @@ def process_start():
   global config
   write_log("processing system startup")
   alarm = config['alarm']
-
-  # check alarm
-  rtc = ds3231.ds3231(config['i2c'],config['utc'])
+  error = wake_journal.ERR_NONE
+  steps = phase("start",config['boot_deadline'])
+
+  # check alarm (one snapshot: alarm state, time and alarm registers)
+  rtc = ds3231.ds3231(config['i2c'],config['utc'],
+                      transport=config['transport'])
+  lock_bus(rtc)                         # until the alarm is cleared
+  rtc.snapshot()
+  wake_time = time.time()
   (enabled,fired) = rtc.get_alarm_state(alarm)
   mode = "alarm" if enabled and fired else "normal"
   write_log("startup-mode: %s" % mode)
+  rtc_offset = rtc.read_timestamp() + 0.5 - wake_time   # resolution: 1s
+  alarm_time = None
+  if mode == "alarm":
+    try:
+      alarm_time = get_timestamp(rtc.get_alarm_time(alarm))
+    except ValueError:
+      pass
+  steps.step("alarm state")
 
-  # clear and disable alarm
-  rtc.clear_alarm(alarm)
-  rtc.set_alarm(alarm,0)
-  write_log("alarm %d cleared and disabled" % alarm)
-
-  # create status-file /var/run/wake-on-rtc.status
-  with  open("/var/run/wake-on-rtc.status","w") as sfile:
-    sfile.write(mode)
+  # an intermediate wake of the wake plan just shuts down again
+  intermediate = False
+  if mode == "alarm" and config['auto_halt'] > 0:
+    try:
+      intermediate = is_intermediate_wake()
+    except:
+      error = wake_journal.ERR_AUTO_HALT
+      syslog.syslog("Error while reading wake plan: %s" % sys.exc_info()[0])
 
-  # execute hook-command
-  if config['boot_hook']:
+  # start hook-command and the query of the next boot-time, both run
+  # concurrently to the following rtc-accesses
+  if config['boot_hook'] and not intermediate:
     write_log("executing boot-hook %s" % config['boot_hook'])
     try:
-      os.system("%s %s &" % (config['boot_hook'],mode))
+      spawn_hook(config['boot_hook'],mode)
     except:
-      syslog.syslog("Error while executing boot-hook: %s" % sys.exc_info()[0])
+      error = wake_journal.ERR_HOOK
+      syslog.syslog("Error while executing boot-hook: %s" % sys.exc_info()[1])
+  query = None
+  if mode == "alarm" and config['auto_halt'] > 0 and not intermediate:
+    lead_delta = get_lead_time()
+    query = task(get_boottime,lead_delta,steps.remaining())
+  steps.step("hooks started")
+
+  # delay from the alarm to the start of the service
+  latency = None
+  if mode == "alarm" and config['latency']:
+    try:
+      latency = get_wake_latency(rtc)
+      record_latency('start',latency)
+    except:
+      syslog.syslog("Error while recording boot latency: %s" %
+                    sys.exc_info()[0])
+
+  # clear and disable alarm (a recurring alarm stays enabled)
+  with rtc.transaction():
+    rtc.clear_alarm(alarm)
+    if not config['recurring']:
+      rtc.set_alarm(alarm,0)
+  unlock_bus()
+  if config['recurring']:
+    write_log("alarm %d cleared" % alarm)
+  else:
+    write_log("alarm %d cleared and disabled" % alarm)
+
+  # create status-file /var/run/wake-on-rtc.status
+  with  open(STATUS_FILE,"w") as sfile:
+    sfile.write(mode)
+  write_status(phase='start',mode="intermediate" if intermediate else mode,
+               auto_halt="halt" if intermediate else "none",alarm=alarm,
+               alarm_time=alarm_time,wake_time=wake_time,next_boot=None,
+               rtc_offset=rtc_offset,offset_error=0.5)
+  steps.step("alarm cleared")
+
+  if intermediate:
+    write_log("intermediate wake of the wake plan. Shutting down!")
+    os.system("shutdown -P now &")
+    write_journal(rtc,wake_journal.EVENT_START,mode=1,error=error)
+    steps.done()
+    return
+
+  # measure the delay until the system is ready
+  if latency is not None and config['ready_cmd']:
+    run_ready_hook(latency)
+
+  # drift sample (the boot-hook already runs in the background)
+  sample = record_drift(rtc)
+  if sample:
+    write_status(rtc_offset=sample.offset,offset_error=ds3231.TICK_POLL)
+  steps.step("drift sample")
 
   # check if we need to shutdown
-  if mode == "alarm" and config['auto_halt'] > 0:
+  if query:
     write_log("processing auto_halt: checking for next boot-time")
-    try:
-      boot_dt = get_boottime()
-      if boot_dt:
-        # calculate now+auto_halt
-        limit_dt = (datetime.datetime.now() +
-                    datetime.timedelta(minutes=config['auto_halt']))
-        write_log("now+auto_halt: %s" % limit_dt)
-        if boot_dt > limit_dt:
-          write_log("next boot-time is after limit. Shutting down!")
-          os.system("shutdown -P +1 &")
-    except:
-      syslog.syslog("Error while auto_halt uprocessing: %s" % sys.exc_info()[0])
+    (boot_dt,query_error) = wait_boottime(query,steps,lead_delta)
+    if query_error != wake_journal.ERR_NONE:
+      error = query_error
+    steps.step("next boot-time")
+    decision = "stay"
+    if boot_dt:
+      # calculate now+auto_halt
+      limit_dt = (datetime.datetime.now() +
+                  datetime.timedelta(minutes=config['auto_halt']))
+      write_log("now+auto_halt: %s" % limit_dt)
+      if boot_dt > limit_dt:
+        write_log("next boot-time is after limit. Shutting down!")
+        os.system("shutdown -P +1 &")
+        decision = "halt"
+    elif query_error != wake_journal.ERR_NONE:
+      decision = "error"
+    write_status(auto_halt=decision,
+                 next_boot=get_timestamp(boot_dt and boot_dt + lead_delta))
+
+  write_journal(rtc,wake_journal.EVENT_START,
+                mode=int(mode == "alarm"),error=error)
+  steps.done()
 
 # --- system shutdown   ----------------------------------------------------
 
@@ -169,24 +710,88 @@ def process_stop():
   global config
   write_log("processing system shutdown")
   alarm = config['alarm']
+  steps = phase("stop",config['halt_deadline'])
+
+  # query next boot-time in the background (the next_boot-hook is killed
+  # at the deadline)
+  lead_delta = get_lead_time()
+  query = task(get_boottime,lead_delta,steps.remaining())
+  steps.step("query started")
+
+  # meanwhile: drift sample, then update hwclock from system-time
+  rtc = ds3231.ds3231(config['i2c'],config['utc'],
+                      transport=config['transport'])
+  record_drift(rtc)
+  hwclock_error = wake_journal.ERR_NONE
+  if config['set_hwclock'] == 1:
+    # a failure must not prevent setting the alarm below
+    try:
+      import ds3231_sync
+      lock_bus(rtc)
+      try:
+        result = ds3231_sync.system_to_rtc(rtc)
+      finally:
+        unlock_bus()
+      write_log("updated rtc-clock from system-time (%s)" %
+                ds3231_sync.format_result(result))
+      record_drift(rtc,1)              # ds3231_drift.SET: new segment
+    except:
+      hwclock_error = wake_journal.ERR_HWCLOCK
+      syslog.syslog("Error while updating rtc-clock: %s" % sys.exc_info()[1])
+  steps.step("hwclock")
+
+  # wait for the boot-time (or use the cached boot-time)
+  (boot_dt,error) = wait_boottime(query,steps,lead_delta)
+  if error == wake_journal.ERR_NONE:
+    error = hwclock_error
+  steps.step("next boot-time")
+
+  # plan intermediate wakes if the boot-time is beyond the horizon
+  alarm_dt = boot_dt
+  if not config['recurring']:
+    try:
+      if boot_dt:
+        alarm_dt = plan_wakes(boot_dt)
+      else:
+        import wake_plan
+        wake_plan.remove(get_plan_file())
+    except:
+      boot_dt = alarm_dt = None
+      error = wake_journal.ERR_NEXT_BOOT
+      syslog.syslog("Error while planning wakes: %s" % sys.exc_info()[1])
+    steps.step("wake plan")
 
-  # set alarm
-  rtc = ds3231.ds3231(config['i2c'],config['utc'])
+  # set alarm (all registers are written in one transaction)
+  lock_bus(rtc)
   try:
-    rtc.clear_alarm(alarm)           # always clear the alarm
-    boot_dt = get_boottime()
+    with rtc.transaction(verify=True):
+      rtc.clear_alarm(alarm)           # always clear the alarm
+      if boot_dt and config['recurring']:
+        # a recurring alarm is only reprogrammed if it changed
+        every  = config['recurring'][0]
+        fields = ds3231.recurring_fields(every,boot_dt)
+        if rtc.get_alarm_recurring(alarm) != (every,fields):
+          rtc.set_alarm_recurring(alarm,every,**fields)
+        rtc.set_alarm(alarm,1)
+      elif boot_dt:
+        rtc.set_alarm_time(alarm,alarm_dt)
+        rtc.set_alarm(alarm,1)
     if boot_dt:
-      rtc.set_alarm_time(alarm,boot_dt)
-      write_log("alarm %d set to %s" % (alarm,boot_dt))
-      rtc.set_alarm(alarm,1)
+      write_log("alarm %d set to %s" % (alarm,alarm_dt))
       write_log("alarm %d cleared and enabled" % alarm)
   except:
+    error = wake_journal.ERR_ALARM
     syslog.syslog("Error while setting alarm-time: %s" % sys.exc_info()[0])
+  unlock_bus()
+  write_status(phase='stop',alarm=alarm,
+               alarm_time=None if error == wake_journal.ERR_ALARM else
+                          get_timestamp(alarm_dt),
+               next_boot=get_timestamp(boot_dt and boot_dt + lead_delta))
+  steps.step("alarm")
 
-  # update hwclock from system-time
-  if config['set_hwclock'] == 1:
-    rtc.write_system_datetime_now()
-    write_log("updated rtc-clock from system-time")
+  write_journal(rtc,wake_journal.EVENT_STOP,alarm=alarm_dt,
+                lead_time=int(lead_delta.total_seconds()) // 60,error=error)
+  steps.done()
 
 # --------------------------------------------------------------------------
 
@@ -197,31 +802,39 @@ def signal_handler(_signo, _stack_frame):
 
 # --- main program   -------------------------------------------------------
 
-syslog.openlog("wake-on-rtc")
-fp_log = open("/var/log/wake-on-rtc.log","at")
-
-parser = ConfigParser.RawConfigParser(
-  {'debug': '0',
-   'alarm': 1,
-   'i2c': 1,
-   'utc': 1})
-parser.read('/etc/wake-on-rtc.conf')
-config = get_config(parser)
-write_log("Config: " + str(config))
-
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
-
-try:
-  if len(sys.argv) != 2:
-    write_log("missing argument")
-  elif sys.argv[1] == "start":
-    process_start()
-  elif sys.argv[1] == "stop":
-    process_stop()
-  else:
-    write_log("unsupported argument")
-except:
-  syslog.syslog("Error while executing service: %s" % sys.exc_info()[0])
-  raise
-fp_log.close()
+def main(argv):
+  """ main program: argv[1] is start or stop """
+  global config
+  syslog.openlog("wake-on-rtc")
+
+  parser = ConfigParser.RawConfigParser(
+    {'debug': '0',
+     'alarm': 1,
+     'i2c': 1,
+     'utc': 1,
+     'journal': 0,
+     'transport': 'smbus'})
+  parser.read(CONFIG_FILE)
+  config = get_config(parser)
+  write_log("Config: " + str(config))
+
+  signal.signal(signal.SIGTERM, signal_handler)
+  signal.signal(signal.SIGINT, signal_handler)
+
+  try:
+    if len(argv) != 2:
+      write_log("missing argument")
+    elif argv[1] == "start":
+      process_start()
+    elif argv[1] == "stop":
+      process_stop()
+    else:
+      write_log("unsupported argument")
+  except:
+    syslog.syslog("Error while executing service: %s" % sys.exc_info()[0])
+    raise
+  if fp_log:
+    fp_log.close()
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Binary wake/boot journal stored in the AT24C32 of the DS3231-module.
+#
+# The journal is a ring buffer of fixed size records. Every append writes
+# the next slot, so all slots wear evenly. Each record carries a sequence
+# number (to find the head after a reboot) and a CRC-8.
+#
+# Record layout (16 bytes, little endian, two records per EEPROM page):
+#   seq       uint16   sequence number (0xFFFF: empty slot)
+#   time      uint32   time of the event (seconds since the epoch)
+#   alarm     uint32   programmed alarm (seconds since the epoch, 0: none)
+#   flags     uint8    bit 0: event (0: start, 1: stop)
+#                      bit 1: wake mode (0: normal, 1: alarm)
+#   lead_time uint8    lead time in minutes (saturates at 255)
+#   temp      int16    temperature in 1/4 degrees Celsius
+#   error     uint8    error code (see ERR_*)
+#   crc       uint8    CRC-8 (polynomial 0x31) of the first 15 bytes
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import struct, time, collections
+from datetime import datetime
+
+import ds3231
+
+EVENT_START = 0
+EVENT_STOP  = 1
+
+ERR_NONE      = 0
+ERR_NEXT_BOOT = 1            # next_boot-hook failed
+ERR_ALARM     = 2            # setting the alarm failed
+ERR_HOOK      = 3            # boot-hook failed
+ERR_AUTO_HALT = 4            # auto_halt processing failed
+ERR_TIMEOUT   = 5            # next_boot-hook timed out (cached boot-time)
+ERR_HWCLOCK   = 6            # update of the rtc from the system time failed
+
+ERRORS = {ERR_NONE:      "ok",
+          ERR_NEXT_BOOT: "next_boot failed",
+          ERR_ALARM:     "set alarm failed",
+          ERR_HOOK:      "boot-hook failed",
+          ERR_AUTO_HALT: "auto_halt failed",
+          ERR_TIMEOUT:   "next_boot timed out",
+          ERR_HWCLOCK:   "set hwclock failed"}
+
+RECORD_SIZE = 16
+_RECORD     = struct.Struct("<HIIBBhB")
+_EMPTY_SEQ  = 0xFFFF
+
+record = collections.namedtuple("record",
+              "seq time event mode alarm lead_time temp error")
+
+def _crc8_table():
+    """
+    Create the lookup-table for the CRC-8 with polynomial 0x31
+    """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return tuple(table)
+
+_CRC8 = _crc8_table()
+
+def crc8(data):
+    """
+    Calculate the CRC-8 of a bytearray
+    """
+    crc = 0
+    for byte in data:
+        crc = _CRC8[crc ^ byte]
+    return crc
+
+def encode(rec):
+    """
+    Encode a record into a bytearray of RECORD_SIZE bytes
+    """
+    data = bytearray(_RECORD.pack(rec.seq,int(rec.time),int(rec.alarm or 0),
+                                  (rec.event & 1) | ((rec.mode & 1) << 1),
+                                  min(max(rec.lead_time,0),255),
+                                  int(round((rec.temp or 0)*4)),rec.error))
+    data.append(crc8(data))
+    return data
+
+def decode(data):
+    """
+    Decode a record. Returns None for empty slots and records with an
+    invalid CRC.
+    """
+    data = bytearray(data)
+    (seq,tstamp,alarm,flags,lead_time,temp,error) = _RECORD.unpack_from(
+        bytes(data))
+    if seq == _EMPTY_SEQ or crc8(data[:RECORD_SIZE-1]) != data[RECORD_SIZE-1]:
+        return None
+    return record(seq,tstamp,flags & 1,(flags >> 1) & 1,alarm,lead_time,
+                  temp/4.0,error)
+
+def format_record(rec):
+    """
+    Format a record as a single line of text
+    """
+    alarm = datetime.fromtimestamp(rec.alarm) if rec.alarm else "-"
+    return "%5d %s %-5s %-6s alarm: %-19s lead: %3d temp: %6.2f %s" % (
+        rec.seq,datetime.fromtimestamp(rec.time),
+        "stop" if rec.event == EVENT_STOP else "start",
+        "alarm" if rec.mode else "normal",alarm,rec.lead_time,rec.temp,
+        ERRORS.get(rec.error,"error %d" % rec.error))
+
+class journal(object):
+    """
+    Ring buffer of records in the AT24C32.
+    """
+
+    def __init__(self,rtc,offset=0,size=ds3231.AT24C32_SIZE):
+        """
+        Use size bytes of the AT24C32 starting at offset (both must be
+        multiples of RECORD_SIZE).
+        """
+        if offset % RECORD_SIZE or size % RECORD_SIZE or size < 2*RECORD_SIZE:
+            raise ValueError("invalid journal area")
+        self._rtc   = rtc
+        self._offset = offset
+        self._slots = size // RECORD_SIZE
+        self._head  = None                 # (next slot,next seq)
+
+    def _read_seq(self,slot):
+        """ read the sequence number of a slot (None if empty) """
+        data = self._rtc.read_at24c32(self._offset+slot*RECORD_SIZE,2)
+        seq = data[0] | (data[1] << 8)
+        return None if seq == _EMPTY_SEQ else seq
+
+    def _read_slots(self,slot,count):
+        """ read and decode count slots starting at slot (no wrap-around) """
+        data = self._rtc.read_at24c32(self._offset+slot*RECORD_SIZE,
+                                      count*RECORD_SIZE)
+        return [decode(data[i:i+RECORD_SIZE])
+                for i in range(0,len(data),RECORD_SIZE)]
+
+    def _find_head(self):
+        """
+        Find the next slot to write. The sequence numbers increase by one
+        from slot to slot up to the last record written, so a binary search
+        needs only O(log n) slot reads. The search trusts the raw sequence
+        numbers, so the last record found (and slot 0) must pass the CRC
+        check; otherwise (e.g. a torn write) all slots are scanned.
+        """
+        first = self._read_seq(0)
+        if first is None:
+            return (0,0)
+        low, high = 0, self._slots - 1       # invariant: slot low is in order
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self._read_seq(mid) == (first + mid) % _EMPTY_SEQ:
+                low = mid
+            else:
+                high = mid - 1
+        last = self._read_slots(low,1)[0]
+        if (last is None or last.seq != (first + low) % _EMPTY_SEQ or
+            (low and self._read_slots(0,1)[0] is None)):
+            return self._scan_head()
+        return ((low + 1) % self._slots,(last.seq + 1) % _EMPTY_SEQ)
+
+    def _scan_head(self):
+        """ find the next slot to write by reading all slots """
+        recs = [(rec,slot)
+                for (slot,rec) in enumerate(self._read_slots(0,self._slots))
+                if rec is not None]
+        if not recs:
+            return (0,0)
+        (rec,slot) = self._order(recs)[-1]
+        return ((slot + 1) % self._slots,(rec.seq + 1) % _EMPTY_SEQ)
+
+    def _order(self,recs):
+        """
+        Order (record,...) tuples by sequence number, taking care of the
+        wrap-around
+        """
+        recs = sorted(recs,key=lambda item: item[0].seq)
+        for i in range(1,len(recs)):
+            if recs[i][0].seq - recs[i-1][0].seq > self._slots:
+                return recs[i:] + recs[:i]
+        return recs
+
+    def append(self,event,mode=0,alarm=None,lead_time=0,temp=None,
+               error=ERR_NONE,tstamp=None):
+        """
+        Append a record. alarm is a naive local datetime or None, tstamp
+        defaults to the current time.
+        """
+        if self._head is None:
+            self._head = self._find_head()
+        (slot,seq) = self._head
+        if alarm is not None:
+            alarm = time.mktime(alarm.timetuple())
+        rec = record(seq,time.time() if tstamp is None else tstamp,
+                     event,mode,alarm,lead_time,temp,error)
+        self._rtc.write_at24c32(self._offset+slot*RECORD_SIZE,encode(rec))
+        self._head = ((slot + 1) % self._slots,(seq + 1) % _EMPTY_SEQ)
+        return rec
+
+    def records(self,count=None):
+        """
+        Return the valid records of the last count slots (None: the complete
+        journal), oldest first. With count, only these slots are read
+        (going back from the head).
+        """
+        if count is None or count >= self._slots:
+            recs = [(rec,) for rec in self._read_slots(0,self._slots)
+                    if rec is not None]
+            return [item[0] for item in self._order(recs)]
+        if count <= 0:
+            return []
+        if self._head is None:
+            self._head = self._find_head()
+        head  = self._head[0]
+        start = (head - count) % self._slots
+        if start < head:
+            recs = self._read_slots(start,count)
+        else:                                        # wraps around
+            recs = (self._read_slots(start,self._slots - start) +
+                    self._read_slots(0,head))
+        return [rec for rec in recs if rec is not None]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Boot latency history: measured delays after an rtc-alarm.
+#
+# Two series of delays (seconds) are recorded on every wake by alarm:
+#   start  - from the alarm to the start of wake-on-rtc.service
+#   ready  - from the alarm until the ready-hook ([boot] ready_cmd) returns
+#
+# Every series keeps the last WINDOW delays (a rolling window). The file
+# is a small binary (magic, then per series a count and the delays as
+# uint16) and is replaced atomically.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, struct, array
+
+HISTORY_FILE = "/var/lib/wake-on-rtc.latency"
+WINDOW       = 64           # delays kept per series
+MIN_SAMPLES  = 5            # delays needed for a percentile
+MAX_LATENCY  = 3600         # seconds, larger delays are ignored
+SERIES       = ('start','ready')
+
+# upper bounds (seconds) of the bins of histogram()
+BINS = (15,30,45,60,90,120,180,240,300,450,600,900,1800,MAX_LATENCY)
+
+_MAGIC = b"WLH1"
+_COUNT = struct.Struct("<H")
+
+class history(object):
+    """
+    Rolling history of boot latencies.
+    """
+
+    def __init__(self,path=HISTORY_FILE,window=WINDOW):
+        self.path   = path
+        self.window = window
+        self.series = dict((name,array.array('H')) for name in SERIES)
+        self.load()
+
+    def load(self):
+        """ load the history (a missing or invalid file is empty) """
+        try:
+            with open(self.path,"rb") as f:
+                data = f.read()
+        except (IOError,OSError):
+            return
+        if data[:len(_MAGIC)] != _MAGIC:
+            return
+        pos = len(_MAGIC)
+        for name in SERIES:
+            try:
+                (count,) = _COUNT.unpack_from(data,pos)
+            except struct.error:
+                return
+            pos += _COUNT.size
+            values = array.array('H')
+            chunk = data[pos:pos+count*values.itemsize]
+            if hasattr(values,'frombytes'):
+                values.frombytes(chunk)
+            else:
+                values.fromstring(chunk)
+            self.series[name] = values
+            pos += count*values.itemsize
+
+    def save(self):
+        """ save the history (atomically) """
+        tmp = self.path + ".tmp"
+        with open(tmp,"wb") as f:
+            f.write(_MAGIC)
+            for name in SERIES:
+                values = self.series[name]
+                f.write(_COUNT.pack(len(values)))
+                values.tofile(f)
+        os.rename(tmp,self.path)
+
+    def add(self,name,seconds):
+        """
+        Add a delay to the given series. Returns False if the delay is not
+        plausible (negative or larger than MAX_LATENCY).
+        """
+        if seconds < 0 or seconds > MAX_LATENCY:
+            return False
+        values = self.series[name]
+        values.append(int(round(seconds)))
+        if len(values) > self.window:
+            del values[:len(values)-self.window]
+        return True
+
+    def percentile(self,name,percent):
+        """
+        Return the given percentile (nearest rank) of the series in seconds,
+        or None if there are less than MIN_SAMPLES delays.
+        """
+        values = sorted(self.series[name])
+        if len(values) < MIN_SAMPLES:
+            return None
+        rank = max(1,int(-(-percent*len(values) // 100)))     # ceil
+        return values[min(rank,len(values))-1]
+
+    def histogram(self,name):
+        """
+        Return the histogram of the series as a list of tuples
+        (upper bound in seconds,count)
+        """
+        counts = [0]*len(BINS)
+        for value in self.series[name]:
+            for i,bound in enumerate(BINS):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+        return list(zip(BINS,counts))
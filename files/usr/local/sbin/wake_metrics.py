@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Metrics of the RTC and of wake-on-rtc.service in the text format of
+# Prometheus (for the textfile-collector of node_exporter).
+#
+# All register values are taken from one snapshot. The offset of the RTC
+# to the system time has a resolution of one second (use the drift history
+# for exact values). The bus statistics are those of the driver, i.e. of
+# the rtc daemon if rtcctl uses it, and grow during the lifetime of the
+# process.
+#
+# The service stores the durations of the steps of its last start and
+# stop phase in TIMINGS_FILE, one line per phase:
+#
+#   phase timestamp step=seconds step=seconds ...
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, time
+
+import ds3231_transport
+
+TEXTFILE     = "/var/lib/node_exporter/textfile_collector/rtc.prom"
+TIMINGS_FILE = "/var/lib/wake-on-rtc.timings"    # written by the service,
+STATUS_FILE  = "/var/run/wake-on-rtc.status"     # which imports both paths
+
+# --- phase timings of the service   ---------------------------------------
+
+def load_timings(path=TIMINGS_FILE):
+    """
+    Return the stored timings as dict phase -> (timestamp,[(step,seconds)])
+    """
+    result = {}
+    try:
+        with open(path,"r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                steps = []
+                for field in fields[2:]:
+                    (step,_,seconds) = field.partition('=')
+                    steps.append((step,float(seconds)))
+                result[fields[0]] = (float(fields[1]),steps)
+    except (IOError,OSError,ValueError):
+        pass
+    return result
+
+def save_timings(phase,steps,path=TIMINGS_FILE,stamp=None):
+    """
+    Store the durations of the steps of a phase (list of tuples
+    (step,seconds)) and keep the other phases (atomically)
+    """
+    timings = load_timings(path)
+    timings[phase] = (stamp or time.time(),steps)
+    tmp = path + ".tmp"
+    with open(tmp,"w") as f:
+        for name in sorted(timings):
+            (stamp,steps) = timings[name]
+            f.write("%s %d %s\n" % (name,stamp," ".join(
+                "%s=%.3f" % (step.replace(' ','_'),seconds)
+                for (step,seconds) in steps)))
+    os.rename(tmp,path)
+
+# --- text format   --------------------------------------------------------
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key,str(value).replace('"','\\"'))
+                             for (key,value) in sorted(labels.items()))
+
+def _value(value):
+    if isinstance(value,float):
+        return repr(value)
+    return "%d" % value
+
+class textfile(object):
+    """
+    Metrics in the text format of Prometheus
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def metric(self,name,kind,text,samples):
+        """
+        Add a metric of the given kind (gauge or counter) with a list of
+        samples (labels as dict,value)
+        """
+        self.lines.append("# HELP %s %s" % (name,text))
+        self.lines.append("# TYPE %s %s" % (name,kind))
+        for (labels,value) in samples:
+            self.lines.append("%s%s %s" % (name,_labels(labels),_value(value)))
+
+    def histogram(self,name,text,bounds,samples):
+        """
+        Add a histogram with a list of samples (labels as dict,counts,sum)
+        where counts are the counts per bucket (not cumulative), the last
+        one for values larger than the last bound
+        """
+        self.lines.append("# HELP %s %s" % (name,text))
+        self.lines.append("# TYPE %s histogram" % name)
+        for (labels,counts,total) in samples:
+            cumulative = 0
+            for (bound,count) in zip(list(bounds)+["+Inf"],counts):
+                cumulative += count
+                bucket = dict(labels,le=bound)
+                self.lines.append("%s_bucket%s %d" % (name,_labels(bucket),
+                                                      cumulative))
+            self.lines.append("%s_sum%s %s" % (name,_labels(labels),
+                                               repr(float(total))))
+            self.lines.append("%s_count%s %d" % (name,_labels(labels),
+                                                 cumulative))
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+# --- collect   ------------------------------------------------------------
+
+def _rtc_metrics(out,rtc):
+    """ add the metrics of the registers (one snapshot) """
+    rtc.snapshot(True)
+    now = time.time()
+    dtime = rtc.read_datetime()              # local time, truncated seconds
+    out.metric("rtc_time_offset_seconds","gauge",
+               "offset of the RTC to the system time (resolution: 1s)",
+               [({},round(time.mktime(dtime.timetuple()) + 0.5 - now,3))])
+    out.metric("rtc_temperature_celsius","gauge",
+               "temperature of the RTC",[({},float(rtc.get_temp()))])
+    out.metric("rtc_aging_offset","gauge",
+               "aging offset of the RTC (0.1ppm per step)",
+               [({},rtc.get_aging_offset())])
+    out.metric("rtc_oscillator_stopped","gauge",
+               "oscillator-stop flag (time probably invalid)",
+               [({},rtc.get_oscillator_stopped())])
+    (enabled,fired,alarms) = ([],[],[])
+    for alarm in (1,2):
+        labels = {'alarm': alarm}
+        state = rtc.get_alarm_state(alarm)
+        enabled.append((labels,state[0]))
+        fired.append((labels,state[1]))
+        try:
+            alarm_dt = rtc.get_alarm_time(alarm)
+            alarms.append((labels,time.mktime(alarm_dt.timetuple())))
+        except ValueError:                   # invalid alarm registers
+            pass
+    out.metric("rtc_alarm_enabled","gauge","alarm is enabled",enabled)
+    out.metric("rtc_alarm_fired","gauge","alarm-flag is set",fired)
+    out.metric("rtc_alarm_timestamp_seconds","gauge",
+               "next time of the alarm (last time if it fired)",alarms)
+
+def _bus_metrics(out,rtc):
+    """ add the statistics of the bus operations of the driver """
+    ops = sorted(rtc.get_bus_stats().items())
+    out.metric("rtc_bus_operations_total","counter",
+               "bus operations of the driver",
+               [({'op': op},stat['calls']) for (op,stat) in ops])
+    out.metric("rtc_bus_transactions_total","counter",
+               "i2c-transactions of the driver",
+               [({'op': op},stat['transactions']) for (op,stat) in ops])
+    out.histogram("rtc_bus_latency_seconds","latency of the bus operations",
+                  ds3231_transport.LATENCY_BUCKETS,
+                  [({'op': op},stat['buckets'],stat['seconds'])
+                   for (op,stat) in ops])
+
+def _service_metrics(out,status_file,timings_file):
+    """ add the last boot mode and the phase durations of the service """
+    try:
+        with open(status_file,"r") as f:
+            mode = f.read().strip()
+        out.metric("wake_boot_mode","gauge","mode of the last boot",
+                   [({'mode': m},int(m == mode)) for m in ("alarm","normal")])
+    except (IOError,OSError):
+        pass
+    timings = sorted(load_timings(timings_file).items())
+    if timings:
+        out.metric("wake_phase_timestamp_seconds","gauge",
+                   "end of the last start/stop phase of the service",
+                   [({'phase': phase},float(stamp))
+                    for (phase,(stamp,_)) in timings])
+        out.metric("wake_phase_step_seconds","gauge",
+                   "durations of the steps of the last start/stop phase",
+                   [({'phase': phase,'step': step},seconds)
+                    for (phase,(_,steps)) in timings
+                    for (step,seconds) in steps])
+
+def collect(rtc,status_file=STATUS_FILE,timings_file=TIMINGS_FILE):
+    """
+    Collect all metrics and return them in the text format
+    """
+    out = textfile()
+    (start,count) = (time.time(),rtc.transactions)
+    try:
+        _rtc_metrics(out,rtc)
+        up = 1
+    except (IOError,OSError):
+        up = 0
+    out.metric("rtc_up","gauge","the RTC could be read",[({},up)])
+    _service_metrics(out,status_file,timings_file)
+    _bus_metrics(out,rtc)
+    out.metric("rtc_scrape_transactions","gauge",
+               "i2c-transactions of this scrape",
+               [({},rtc.transactions - count)])
+    out.metric("rtc_scrape_duration_seconds","gauge",
+               "duration of this scrape",[({},round(time.time()-start,6))])
+    return out.text()
+
+def write_textfile(path,text):
+    """ write the metrics atomically (the collector ignores *.tmp) """
+    tmp = path + ".tmp"
+    with open(tmp,"w") as f:
+        f.write(text)
+    os.rename(tmp,path)
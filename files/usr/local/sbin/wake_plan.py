@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Wake plan: reach boot-times beyond the horizon of the DS3231.
+#
+# An alarm fires on the first match of day-of-month, hour, minute and
+# second (alarm2: without seconds), so a boot-time is only reachable
+# directly if the alarm does not match earlier, i.e. within about a month.
+# Day-of-month alarms have the longest reach of all mask modes, so the
+# planner chains them: every intermediate wake is the latest time (with
+# the time-of-day of the target) reachable from the previous one. Since
+# the reachable times form an interval growing with the start, this
+# greedy choice gives the minimum number of wakes.
+#
+# The plan is stored (one datetime per line: target, then all wakes) so
+# that the service recognizes an intermediate wake at boot and shuts down
+# again immediately.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import ds3231_alarm
+
+PLAN_FILE = "/var/lib/wake-on-rtc.plan"
+MARGIN    = timedelta(hours=1)       # intermediate wake until alarm is set
+TOLERANCE = timedelta(minutes=30)    # boot-time after an intermediate wake
+MIN_DAYS  = 28                       # guaranteed reach of a single alarm
+MAX_DAYS  = 62                       # maximum reach (skipping short months)
+
+_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def alarm_tuple(alarm,dtime):
+    """ day-of-month alarm for the given datetime (as used by set_alarm_time) """
+    return (dtime.day,None,dtime.hour,dtime.minute,
+            dtime.second if alarm == 1 else 0)
+
+def reachable(alarm,start,dtime,convert=None):
+    """
+    Check if an alarm set at start fires first at dtime. convert maps local
+    times to the time of the RTC (e.g. to UTC), None: no conversion.
+    """
+    if convert:
+        (start,dtime) = (convert(start),convert(dtime))
+    return ds3231_alarm.next_match(alarm_tuple(alarm,dtime),start) == dtime
+
+def plan(alarm,now,target,margin=MARGIN,convert=None):
+    """
+    Return the list of wakes (intermediate wakes and the target) to reach
+    the target, starting at now. Alarms of intermediate wakes are set at
+    most margin after the wake. See reachable() for convert.
+    """
+    if alarm == 2:
+        target = target.replace(second=0)
+    if target <= now:
+        raise ValueError("boot-time %s is not after %s" % (target,now))
+
+    # breadth-first search over the candidates target - n days (n=0: the
+    # target), latest candidates first. Everything within MIN_DAYS is
+    # reachable, beyond that up to MAX_DAYS it depends on the month lengths
+    candidates = [target]
+    while candidates[-1] - timedelta(days=1) > now:
+        candidates.append(candidates[-1] - timedelta(days=1))
+    (parent,layer) = ({},[(now,None)])
+    while not 0 in parent:
+        next_layer = []
+        for (start,node) in layer:
+            for n in range(len(candidates)):
+                wake = candidates[n]
+                if wake - start > timedelta(days=MAX_DAYS) or n in parent:
+                    continue
+                if wake <= start:
+                    break
+                if (wake - start < timedelta(days=MIN_DAYS) or
+                    reachable(alarm,start,wake,convert)):
+                    parent[n] = node
+                    next_layer.append((wake+margin,n))
+        if not next_layer:
+            raise ValueError("no plan from %s to %s" % (now,target))
+        layer = next_layer
+
+    wakes = [0]
+    while parent[wakes[-1]] is not None:
+        wakes.append(parent[wakes[-1]])
+    return [candidates[n] for n in reversed(wakes)]
+
+def save(path,target,wakes):
+    """ store the plan (atomically); a plan without intermediate wakes is removed """
+    if len(wakes) < 2:
+        remove(path)
+        return
+    tmp = path + ".tmp"
+    with open(tmp,"w") as f:
+        for dtime in [target] + wakes:
+            f.write(dtime.strftime(_FORMAT)+"\n")
+    os.rename(tmp,path)
+
+def load(path):
+    """ return the stored plan as tuple (target,wakes), or None """
+    try:
+        with open(path,"r") as f:
+            dtimes = [datetime.strptime(line.strip(),_FORMAT)
+                      for line in f if line.strip()]
+    except (IOError,OSError,ValueError):
+        return None
+    return (dtimes[0],dtimes[1:]) if len(dtimes) > 1 else None
+
+def remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+def is_intermediate(path,now,tolerance=TOLERANCE):
+    """
+    Check if now is an intermediate wake of the stored plan, i.e. within
+    tolerance after one of the wakes except the last one.
+    """
+    stored = load(path)
+    if not stored:
+        return False
+    return any(wake <= now <= wake + tolerance for wake in stored[1][:-1])
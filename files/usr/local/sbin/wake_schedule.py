@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Wake schedule: a built-in replacement for the next_boot-hook.
+#
+# The schedule file has one entry per line (empty lines and lines
+# starting with # are ignored):
+#
+#   30 6 * * 1-5                 cron-like: minute hour day month weekday
+#   2024-12-24 08:00             one-off (also dd.mm.YYYY and mm/dd/YYYY,
+#                                seconds are optional)
+#   ! 2024-12-25                 exclusion of a day
+#   ! 2024-12-24 .. 2024-12-31   exclusion of a range of days (inclusive)
+#   ! 2024-12-23 06:30           exclusion of a single wake-time
+#   ! 30 6 * * 5                 exclusion of all times of a cron-entry
+#
+# Cron-fields support *, lists, ranges and steps (e.g. 1-5,*/10) and the
+# english three-letter names of months and weekdays (0 and 7: sunday).
+# As with cron, if day and weekday are both restricted, a day matching
+# either field matches.
+#
+# All entries are expanded into a sorted index (local time, seconds since
+# the epoch) for the next HORIZON_DAYS days, so a query is a bisect. The
+# index is cached on disk and only rebuilt if the schedule file changed
+# (mtime and size) or the index does not cover the query anymore.
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, struct, array, bisect
+from datetime import datetime, timedelta
+
+HORIZON_DAYS = 400          # days covered by the index
+REBUILD_DAYS = 32           # rebuild if the index ends within these days
+CACHE_FILE   = "/var/cache/wake-on-rtc.schedule"
+
+_EPOCH  = datetime(1970,1,1)
+_DAY    = 86400
+_MAGIC  = b"WSC1"
+_HEADER = struct.Struct("<4sdqqqI")  # magic,mtime,size,start,end,count
+_TYPECODE = 'I' if array.array('I').itemsize == 4 else 'L'
+
+_FORMATS = ("%Y-%m-%d %H:%M:%S","%Y-%m-%d %H:%M","%Y-%m-%d",
+            "%d.%m.%Y %H:%M:%S","%d.%m.%Y %H:%M","%d.%m.%Y",
+            "%m/%d/%Y %H:%M:%S","%m/%d/%Y %H:%M","%m/%d/%Y")
+
+_NAMES = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+          'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+          'sun': 0, 'mon': 1, 'tue': 2, 'wed': 3, 'thu': 4, 'fri': 5,
+          'sat': 6}
+
+def _seconds(dtime):
+    """ seconds since the epoch of a naive datetime """
+    delta = dtime - _EPOCH
+    return delta.days*_DAY + delta.seconds
+
+def _parse_datetime(text):
+    for format in _FORMATS:
+        try:
+            return datetime.strptime(text,format)
+        except ValueError:
+            pass
+    raise ValueError("invalid date: %s" % text)
+
+def _parse_field(text,low,high):
+    """
+    Parse a cron-field into a frozenset of values (None for *)
+    """
+    if text == '*':
+        return None
+    values = set()
+    for part in text.split(','):
+        (part,_,step) = part.partition('/')
+        if part == '*':
+            (first,last) = (low,high)
+        else:
+            (first,_,last) = part.partition('-')
+            first = _NAMES.get(first.lower()) if first.isalpha() else int(first)
+            last  = first if not last else (
+                _NAMES.get(last.lower()) if last.isalpha() else int(last))
+        if first is None or last is None or first < low or last > high:
+            raise ValueError("invalid cron-field: %s" % text)
+        values.update(range(first,last+1,int(step) if step else 1))
+    return frozenset(values)
+
+class cron_entry(object):
+    """
+    A cron-like entry (minute hour day month weekday)
+    """
+
+    def __init__(self,fields):
+        minutes = _parse_field(fields[0],0,59)
+        hours   = _parse_field(fields[1],0,23)
+        self.days     = _parse_field(fields[2],1,31)
+        self.months   = _parse_field(fields[3],1,12)
+        self.weekdays = _parse_field(fields[4],0,7)
+        if self.weekdays is not None and 7 in self.weekdays:
+            self.weekdays = self.weekdays | frozenset([0])
+        # offsets (seconds) of all matching times within a day
+        self.offsets = sorted(h*3600 + m*60
+                              for h in (hours or range(24))
+                              for m in (minutes or range(60)))
+
+    def day_key(self):
+        """ entries with the same key match the same days """
+        return (self.days,self.months,self.weekdays)
+
+def _matches_day(key,dtime):
+    (days,months,weekdays) = key
+    if months is not None and dtime.month not in months:
+        return False
+    if days is None and weekdays is None:
+        return True
+    elif weekdays is None:
+        return dtime.day in days
+    elif days is None:
+        return dtime.isoweekday() % 7 in weekdays
+    # like cron: either field matches
+    return dtime.day in days or dtime.isoweekday() % 7 in weekdays
+
+def parse(lines):
+    """
+    Parse the lines of a schedule. Returns a tuple (crons,times,
+    excluded_crons,excluded_times,excluded_days) with the cron_entries,
+    the one-off datetimes and the excluded (first,last) date-ranges.
+    """
+    (crons,times,ex_crons,ex_times,ex_days) = ([],[],[],[],[])
+    for (nr,line) in enumerate(lines,1):
+        line = line.split('#',1)[0].strip()
+        if not line:
+            continue
+        exclude = line.startswith('!')
+        if exclude:
+            line = line[1:].strip()
+        try:
+            fields = line.split()
+            if len(fields) == 5:
+                (ex_crons if exclude else crons).append(cron_entry(fields))
+            elif exclude and '..' in line:
+                (first,_,last) = line.partition('..')
+                ex_days.append((_parse_datetime(first.strip()).date(),
+                                _parse_datetime(last.strip()).date()))
+            elif exclude and len(fields) == 1:
+                day = _parse_datetime(line).date()
+                ex_days.append((day,day))
+            else:
+                (ex_times if exclude else times).append(_parse_datetime(line))
+        except ValueError as e:
+            raise ValueError("line %d: %s" % (nr,e))
+    return (crons,times,ex_crons,ex_times,ex_days)
+
+def _expand(crons,start,end):
+    """
+    Return the set of all times (seconds) of the cron-entries in [start,end)
+    """
+    # entries matching the same days share one day-check
+    groups = {}
+    for cron in crons:
+        groups.setdefault(cron.day_key(),set()).update(cron.offsets)
+    groups = [(key,sorted(offsets)) for key,offsets in groups.items()]
+
+    result = set()
+    day = datetime(start.year,start.month,start.day)
+    while day < end:
+        base = _seconds(day)
+        for (key,offsets) in groups:
+            if _matches_day(key,day):
+                result.update(base + offset for offset in offsets)
+        day += timedelta(days=1)
+    return result
+
+def build_index(entries,start,end):
+    """
+    Build the sorted index (an array of seconds) of all wake-times of the
+    parsed entries in [start,end).
+    """
+    (crons,times,ex_crons,ex_times,ex_days) = entries
+    (first,last) = (_seconds(start),_seconds(end))
+    wakes = _expand(crons,start,end)
+    wakes.update(s for s in map(_seconds,times) if first <= s < last)
+    wakes.difference_update(_expand(ex_crons,start,end))
+    wakes.difference_update(map(_seconds,ex_times))
+
+    # excluded days as set of the seconds at midnight
+    days = set()
+    for (day1,day2) in ex_days:
+        low  = max(_seconds(datetime(day1.year,day1.month,day1.day)),first)
+        high = min(_seconds(datetime(day2.year,day2.month,day2.day)),last)
+        days.update(range(low - low % _DAY,high+1,_DAY))
+    return array.array(_TYPECODE,sorted(s for s in wakes
+                                        if first <= s < last and
+                                        s - s % _DAY not in days))
+
+class schedule(object):
+    """
+    Indexed wake schedule of a schedule file.
+    """
+
+    def __init__(self,path,cache=CACHE_FILE,horizon=HORIZON_DAYS):
+        """
+        path is the schedule file, cache the file for the index (None: do
+        not cache) and horizon the number of days covered by the index
+        (more than REBUILD_DAYS).
+        """
+        self.path    = path
+        self.cache   = cache
+        self.horizon = horizon
+        self._index  = None
+        self._range  = (0,0)                # (start,end) of the index
+
+    def _covers(self,seconds):
+        (start,end) = self._range
+        return start <= seconds <= end - REBUILD_DAYS*_DAY
+
+    def _load_cache(self,stat):
+        """ load the cached index, returns False if it is not valid """
+        try:
+            with open(self.cache,"rb") as f:
+                (magic,mtime,size,start,end,count) = _HEADER.unpack(
+                    f.read(_HEADER.size))
+                if (magic != _MAGIC or mtime != stat.st_mtime or
+                    size != stat.st_size):
+                    return False
+                index = array.array(_TYPECODE)
+                data = f.read()
+        except (IOError,OSError,struct.error):
+            return False
+        if len(data) != count*index.itemsize:
+            return False
+        if hasattr(index,'frombytes'):
+            index.frombytes(data)
+        else:
+            index.fromstring(data)
+        self._index = index
+        self._range = (start,end)
+        return True
+
+    def _save_cache(self,stat):
+        """ save the index (atomically, errors are ignored) """
+        tmp = self.cache + ".tmp"
+        try:
+            with open(tmp,"wb") as f:
+                f.write(_HEADER.pack(_MAGIC,stat.st_mtime,stat.st_size,
+                                     self._range[0],self._range[1],
+                                     len(self._index)))
+                self._index.tofile(f)
+            os.rename(tmp,self.cache)
+        except (IOError,OSError):
+            pass
+
+    def load(self,now=None):
+        """
+        Make sure the index covers now (default: the current time):
+        use the cached index if possible, otherwise parse the schedule.
+        """
+        now = now or datetime.now()
+        seconds = _seconds(now)
+        stat = os.stat(self.path)
+        if self._index is not None and self._covers(seconds):
+            return
+        if self.cache and self._load_cache(stat) and self._covers(seconds):
+            return
+        with open(self.path,"r") as f:
+            entries = parse(f)
+        start = datetime(now.year,now.month,now.day)
+        end   = start + timedelta(days=self.horizon)
+        self._index = build_index(entries,start,end)
+        self._range = (_seconds(start),_seconds(end))
+        if self.cache:
+            self._save_cache(stat)
+
+    def next_wake(self,after=None):
+        """
+        Return the first wake-time (naive local datetime) after the given
+        time (default: now), or None.
+        """
+        wakes = self.wakes(after,1)
+        return wakes[0] if wakes else None
+
+    def wakes(self,after=None,count=1):
+        """
+        Return a list of the next count wake-times after the given time
+        """
+        after = after or datetime.now()
+        self.load(after)
+        pos = bisect.bisect_right(self._index,_seconds(after))
+        return [_EPOCH + timedelta(seconds=s)
+                for s in self._index[pos:pos+count]]
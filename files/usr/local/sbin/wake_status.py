@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+# --------------------------------------------------------------------------
+# Status of wake-on-rtc.service for other programs (no access to the RTC).
+#
+# The service publishes its state at boot and shutdown in a small binary
+# block with a fixed layout (little-endian, see _LAYOUT) and in a JSON
+# view of the same values (STATE_FILE + ".json"). Both files are replaced
+# atomically (write and rename), so readers never see a partial update.
+#
+#   magic "WKST", version, size of the block, update counter, time of the
+#   update, phase (start/stop), wake mode, auto_halt decision, alarm,
+#   programmed alarm, wake time, next planned boot, offset of the RTC to
+#   the system time at boot and the error of this offset
+#
+# Times are seconds since the epoch, unknown values are NaN (None in
+# python, empty in the shell). Later versions only append fields, so a
+# reader accepts every block with the same magic and a size of at least
+# _LAYOUT.size.
+#
+# Usage from the shell:
+#   wake_status.py                 all fields as name=value (for eval)
+#   wake_status.py field [...]     the values of the given fields
+#
+# Author: Bernhard Bablok
+# License: GPL3
+#
+# Website: https://github.com/bablokb/pi-wake-on-rtc
+#
+# --------------------------------------------------------------------------
+"""
+
+import os, sys, struct, json, time
+from collections import namedtuple
+
+STATE_FILE = "/run/wake-on-rtc.state"
+VERSION    = 1
+
+PHASES    = ('none','start','stop')
+MODES     = ('unknown','normal','alarm','intermediate')
+AUTO_HALT = ('none','stay','halt','error')    # decision at boot
+
+_MAGIC  = b"WKST"
+_LAYOUT = struct.Struct("<4sHHIdBBBBdddff")
+_NAN    = float('nan')
+
+FIELDS = ('seq','updated','phase','mode','auto_halt','alarm','alarm_time',
+          'wake_time','next_boot','rtc_offset','offset_error')
+TIMES  = ('updated','alarm_time','wake_time','next_boot')
+
+status = namedtuple('status',FIELDS)
+
+EMPTY = status(0,None,'none','unknown','none',0,None,None,None,None,None)
+
+def _float(value):
+    return _NAN if value is None else float(value)
+
+def _value(value):
+    return None if value != value else value              # NaN -> None
+
+def pack(s):
+    """ return the binary block of a status """
+    return _LAYOUT.pack(_MAGIC,VERSION,_LAYOUT.size,s.seq,_float(s.updated),
+                        PHASES.index(s.phase),MODES.index(s.mode),
+                        AUTO_HALT.index(s.auto_halt),s.alarm,
+                        _float(s.alarm_time),_float(s.wake_time),
+                        _float(s.next_boot),_float(s.rtc_offset),
+                        _float(s.offset_error))
+
+def unpack(data):
+    """ return the status of a binary block, None if it is invalid """
+    if len(data) < _LAYOUT.size or data[:len(_MAGIC)] != _MAGIC:
+        return None
+    values = _LAYOUT.unpack_from(data)
+    try:
+        return status(values[3],_value(values[4]),PHASES[values[5]],
+                      MODES[values[6]],AUTO_HALT[values[7]],values[8],
+                      *[_value(v) for v in values[9:]])
+    except IndexError:
+        return None
+
+def read(path=STATE_FILE):
+    """ return the current status, None if there is none """
+    try:
+        with open(path,"rb") as f:
+            return unpack(f.read())
+    except (IOError,OSError):
+        return None
+
+def _replace(path,data,mode):
+    tmp = path + ".tmp"
+    with open(tmp,mode) as f:
+        f.write(data)
+    os.rename(tmp,path)
+
+def update(path=STATE_FILE,**fields):
+    """
+    Update the given fields of the status (the others are kept) and write
+    the binary block and the JSON view. Returns the new status.
+    """
+    s = (read(path) or EMPTY)._replace(**fields)
+    s = s._replace(seq=s.seq+1,updated=time.time())
+    _replace(path,pack(s),"wb")
+    view = dict(s._asdict(),version=VERSION)
+    _replace(path+".json",json.dumps(view,sort_keys=True)+"\n","w")
+    return s
+
+# --- shell interface   ----------------------------------------------------
+
+def _format(name,value):
+    if value is None:
+        return ""
+    elif name in TIMES:
+        return "%d" % value
+    elif isinstance(value,float):
+        return "%.3f" % value
+    return str(value)
+
+if __name__ == "__main__":
+    s = read(os.environ.get("WAKE_STATE_FILE",STATE_FILE))
+    if s is None:
+        sys.stderr.write("no status\n")
+        sys.exit(1)
+    names = sys.argv[1:] or FIELDS
+    for name in names:
+        if not name in FIELDS:
+            sys.stderr.write("unknown field: %s\n" % name)
+            sys.exit(2)
+        value = _format(name,getattr(s,name))
+        if sys.argv[1:]:
+            print(value)
+        else:
+            print("%s=%s" % (name,value))